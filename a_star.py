@@ -1,6 +1,8 @@
 import numpy as np
-import matplotlib.pyplot as plt
 from math import sqrt
+import hashlib
+import threading
+from collections import OrderedDict
 
 
 class Node:
@@ -45,12 +47,12 @@ def return_path(current_node,maze):
 
 
 
-def search(maze, start, end, scale_factor):
+def search(maze, start, end, scale_factor, stats=None, cancel_event=None):
 
 
 
-    maze = maze.copy().T
-    maze = maze[::scale_factor, ::scale_factor]  
+    # max pooled so that no obstacle thinner than scale_factor disappears
+    maze = max_pool(np.asarray(maze), scale_factor).T
     
     
     """
@@ -59,6 +61,8 @@ def search(maze, start, end, scale_factor):
         :param cost
         :param start:
         :param end:
+        :param stats: optional dict, the number of expanded nodes is stored under "expansions"
+        :param cancel_event: optional threading.Event, the search returns None once it is set
         :return:
     """
 
@@ -128,9 +132,15 @@ def search(maze, start, end, scale_factor):
     
     while len(yet_to_visit_dict) > 0:
         
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+
         # Every time any node is referred from yet_to_visit list, counter of limit operation incremented
         outer_iterations += 1    
 
+        if stats is not None:
+            stats["expansions"] = outer_iterations
+
         
         # Get the current node
         current_node_position = (-999, -999)
@@ -222,3 +232,204 @@ def search(maze, start, end, scale_factor):
             # Add the child to the yet_to_visit list
             # yet_to_visit_list.append(child)
             yet_to_visit_dict[child.position] = child
+
+
+def max_pool(costMap, factor):
+    """
+    The costmap downsampled by factor, every coarse cell gets the highest cost of the factor x factor
+    cells it covers (the last row and column are padded with their edge values).
+    """
+    if factor == 1:
+        return costMap.copy()
+
+    rows, cols = costMap.shape
+    padded = np.pad(costMap, ((0, -rows % factor), (0, -cols % factor)), mode="edge")
+    return padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor).max(axis=(1, 3))
+
+
+def grid_graph(maze, threshold=0.8):
+    """
+    The 8-connected grid of search as a sparse graph, one vertex per cell (row major) and
+    an edge of length 1 or sqrt(2) between every two adjacent cells with cost <= threshold.
+    """
+    from scipy.sparse import csr_matrix
+
+    rows, cols = maze.shape
+    free = maze <= threshold
+    index = np.arange(rows * cols).reshape(rows, cols)
+
+    heads, tails, weights = [], [], []
+    for d_row, d_col in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+        # every cell paired with its neighbour at (+d_row, +d_col), the other 4 moves are the same edges
+        first = (slice(0, rows - d_row), slice(max(-d_col, 0), cols - max(d_col, 0)))
+        second = (slice(d_row, rows), slice(max(d_col, 0), cols + min(d_col, 0)))
+
+        both = free[first] & free[second]
+        heads.append(index[first][both])
+        tails.append(index[second][both])
+        weights.append(np.full(np.count_nonzero(both), sqrt(d_row**2 + d_col**2)))
+
+    heads, tails, weights = np.concatenate(heads), np.concatenate(tails), np.concatenate(weights)
+    return csr_matrix((weights, (heads, tails)), shape=(rows * cols, rows * cols))
+
+
+class distanceFields:
+    """
+    Cost-to-go fields of one costmap: the Dijkstra distance from a source cell to every cell
+    over the same grid as search (cells indexed like search, maze = costMap.T), with the
+    parent pointers of the shortest path tree. The fields are kept in an LRU cache by source
+    cell, and all the missing fields of a request are computed in a single multi-source call.
+    The cache can be filled from a worker thread, the Dijkstra itself runs outside the lock.
+    """
+
+    def __init__(self, costMap, threshold=0.8, max_fields=16):
+        self.maze = np.asarray(costMap).T
+        self.threshold = threshold
+        self.max_fields = max_fields
+
+        self.graph = grid_graph(self.maze, threshold)
+        self.fields = OrderedDict()
+        self.lock = threading.Lock()
+
+    def cached(self, cell):
+        with self.lock:
+            return tuple(int(v) for v in cell) in self.fields
+
+    def compute(self, cells, starts=()):
+        """
+        Makes sure the fields of all the cells are cached, cells are (row, col) tuples.
+        The cells on obstacles get no field, ValueError lists them once the others are cached.
+        starts: cells that can be on an obstacle, like the start of search (the robot is often in
+        the inflated band around the walls), their field leaves them by a step to a free neighbour.
+        """
+        from scipy.sparse.csgraph import dijkstra
+
+        cells = [tuple(int(v) for v in cell) for cell in cells]
+        starts = {tuple(int(v) for v in cell) for cell in starts}
+        with self.lock:
+            missing = list(dict.fromkeys(cell for cell in cells if cell not in self.fields))
+
+        rejected = [cell for cell in missing if self.maze[cell] > self.threshold and cell not in starts]
+        missing = [cell for cell in missing if cell not in rejected]
+        cells = [cell for cell in cells if cell not in rejected]
+
+        computed = {}
+        if missing:
+            sources = np.ravel_multi_index(np.array(missing).T, self.maze.shape)
+            blocked = [cell for cell in missing if self.maze[cell] > self.threshold]
+            if blocked:
+                dist, predecessors = dijkstra(self.exit_graph(blocked), directed=True, indices=sources,
+                                              return_predecessors=True)
+            else:
+                dist, predecessors = dijkstra(self.graph, directed=False, indices=sources, return_predecessors=True)
+
+            for cell, cell_dist, cell_predecessors in zip(missing, dist, predecessors):
+                computed[cell] = (cell_dist.reshape(self.maze.shape), cell_predecessors)
+
+        with self.lock:
+            self.fields.update(computed)
+            for cell in cells:
+                self.fields.move_to_end(cell)
+
+            while len(self.fields) > max(self.max_fields, len(cells)):
+                self.fields.popitem(last=False)
+
+        if rejected:
+            raise ValueError(f"cells {rejected} are obstacles")
+
+    def exit_graph(self, cells):
+        """
+        The graph with both directions of every edge, plus one way edges from the obstacle cells
+        to their free neighbours: the fields of the cells can leave them, no other path goes through them.
+        """
+        from scipy.sparse import csr_matrix
+
+        rows, cols = self.maze.shape
+        heads, tails, weights = [], [], []
+        for row, col in cells:
+            for d_row in (-1, 0, 1):
+                for d_col in (-1, 0, 1):
+                    neighbour_row, neighbour_col = row + d_row, col + d_col
+                    if not (d_row or d_col) or not (0 <= neighbour_row < rows and 0 <= neighbour_col < cols):
+                        continue
+                    if self.maze[neighbour_row, neighbour_col] <= self.threshold:
+                        heads.append(row * cols + col)
+                        tails.append(neighbour_row * cols + neighbour_col)
+                        weights.append(sqrt(d_row**2 + d_col**2))
+
+        exits = csr_matrix((weights, (heads, tails)), shape=self.graph.shape)
+        return self.graph + self.graph.T + exits
+
+    def resize(self, max_fields):
+        with self.lock:
+            self.max_fields = max_fields
+            while len(self.fields) > max_fields:
+                self.fields.popitem(last=False)
+
+    def field(self, cell):
+        """
+        (distances, predecessors) of the field rooted at cell, it can start on an obstacle like search.
+        """
+        cell = tuple(int(v) for v in cell)
+        # another thread can evict the field between the two steps, it is computed again then
+        while True:
+            self.compute([cell], starts=[cell])
+            with self.lock:
+                if cell in self.fields:
+                    return self.fields[cell]
+
+    def path(self, source, target):
+        """
+        Shortest path source -> target as a list of cells, by walking the parent pointers of the
+        field rooted at source back from target. None if target cannot be reached.
+        """
+        dist, predecessors = self.field(source)
+        target = tuple(int(v) for v in target)
+
+        if not np.isfinite(dist[target]):
+            return None
+
+        root = np.ravel_multi_index(tuple(int(v) for v in source), self.maze.shape)
+        vertex = np.ravel_multi_index(target, self.maze.shape)
+
+        vertices = [vertex]
+        while vertex != root:
+            vertex = predecessors[vertex]
+            vertices.append(vertex)
+
+        rows, cols = np.unravel_index(np.array(vertices[::-1]), self.maze.shape)
+        return list(zip(rows.tolist(), cols.tolist()))
+
+
+# distanceFields of the last costmaps, keyed by their content so that a costmap that is rebuilt
+# identically (planner makes a new likelihood field on every plan) finds its fields again
+DISTANCE_FIELDS = OrderedDict()
+MAX_CACHED_MAPS = 4
+# the planning thread and the field worker of planner look fields up at the same time
+DISTANCE_FIELDS_LOCK = threading.Lock()
+
+
+def costmap_key(costMap, threshold):
+    costMap = np.ascontiguousarray(costMap)
+    return (costMap.shape, hashlib.sha1(costMap.tobytes()).hexdigest(), threshold)
+
+
+def distance_fields_for(costMap, threshold=0.8, max_fields=None):
+    """
+    Cached distanceFields of costMap. max_fields bounds its LRU cache (16 fields when it is
+    created without one), it is applied to the cached fields as well.
+    """
+    key = costmap_key(costMap, threshold)
+
+    with DISTANCE_FIELDS_LOCK:
+        if key not in DISTANCE_FIELDS:
+            DISTANCE_FIELDS[key] = distanceFields(costMap, threshold, 16 if max_fields is None else max_fields)
+            while len(DISTANCE_FIELDS) > MAX_CACHED_MAPS:
+                DISTANCE_FIELDS.popitem(last=False)
+
+        DISTANCE_FIELDS.move_to_end(key)
+        fields = DISTANCE_FIELDS[key]
+
+    if max_fields is not None and max_fields != fields.max_fields:
+        fields.resize(max_fields)
+    return fields
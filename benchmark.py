@@ -0,0 +1,368 @@
+'''
+Benchmark harness for the path planners.
+
+Every planner in PLANNERS is run on every scenario in SCENARIOS for a number of
+random start/goal pairs, and for each run we record:
+
+    wall time, node expansions, peak memory (tracemalloc), path length, success
+
+Scenarios are either circle worlds (the obstacle lists the RRTs use, rasterized
+for the grid planners) or grid worlds (room.pgm and synthetic mazes). The RRT
+family only handles circle obstacles, so it is skipped on grid worlds.
+
+The results are written as JSON, together with the git commit they were produced
+on, so two result files can be compared with --compare to catch regressions:
+
+    python benchmark.py --output results/bench_new.json --compare results/bench_old.json
+
+Everything is seeded from --seed, so the same command does the same work on
+every commit.
+'''
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from a_star import search
+from gridMap import gridMap
+from planner import OBSTACLE_LIST_1, OBSTACLE_LIST_2
+from rrt_connect import RRTConnect
+from rrt_star import RRTStar
+from theta_star import theta_star_for
+
+
+RAND_AREA = [-2, 15]
+ROBOT_RADIUS = 0.2
+
+# a_star treats cells above this cost as walls
+OCCUPIED_COST = 0.8
+
+
+class scenario:
+    """
+    A map to plan in. The costmap follows the a_star convention: a_star works on
+    costMap.T, and cell (i, j) of costMap.T is at origin + (i, j) * resolution.
+    obstacle_list is None for grid-only worlds.
+    """
+
+    def __init__(self, name, costMap, resolution, origin=(0.0, 0.0), obstacle_list=None):
+        self.name = name
+        self.costMap = costMap
+        self.resolution = resolution
+        self.origin = np.array(origin, dtype=float)
+        self.obstacle_list = obstacle_list
+
+    def position_2_cell(self, pos):
+        return tuple(int(v) for v in np.rint((np.asarray(pos) - self.origin) / self.resolution))
+
+    def cell_2_position(self, cell):
+        return list(self.origin + np.asarray(cell, dtype=float) * self.resolution)
+
+    def is_free(self, pos):
+        i, j = self.position_2_cell(pos)
+        maze = self.costMap.T
+        if not (0 <= i < maze.shape[0] and 0 <= j < maze.shape[1]):
+            return False
+        if maze[i, j] > OCCUPIED_COST / 2:
+            return False
+        if self.obstacle_list is None:
+            return True
+        return all(math.hypot(pos[0] - ox, pos[1] - oy) > size + ROBOT_RADIUS
+                   for (ox, oy, size) in self.obstacle_list)
+
+    def random_free_position(self, rng):
+        maze = self.costMap.T
+        high = self.origin + (np.array(maze.shape) - 1) * self.resolution
+        while True:
+            pos = rng.uniform(self.origin, high)
+            if self.is_free(pos):
+                return [float(pos[0]), float(pos[1])]
+
+
+def rasterize_circles(obstacle_list, area, resolution, robot_radius=ROBOT_RADIUS):
+    n = int(round((area[1] - area[0]) / resolution)) + 1
+    coords = area[0] + np.arange(n) * resolution
+    xs, ys = np.meshgrid(coords, coords, indexing="ij")
+
+    maze = np.zeros((n, n))
+    for (ox, oy, size) in obstacle_list:
+        maze[(xs - ox)**2 + (ys - oy)**2 <= (size + robot_radius)**2] = 1.0
+
+    return maze.T
+
+
+def circle_scenario(name, obstacle_list, resolution=0.1):
+    costMap = rasterize_circles(obstacle_list, RAND_AREA, resolution)
+    return scenario(name, costMap, resolution, (RAND_AREA[0], RAND_AREA[0]), obstacle_list)
+
+
+def random_circles_scenario(rng, n_obstacles=12, resolution=0.1):
+    centers = rng.uniform(RAND_AREA[0] + 2, RAND_AREA[1] - 2, size=(n_obstacles, 2))
+    radii = rng.uniform(0.5, 1.5, size=n_obstacles)
+    obstacle_list = [(float(x), float(y), float(r)) for (x, y), r in zip(centers, radii)]
+    return circle_scenario("random_circles", obstacle_list, resolution)
+
+
+def maze_scenario(rng, n_rows=10, n_cols=10, corridor=4, resolution=0.05):
+    """
+    Perfect maze (randomized depth first search) with corridors and walls corridor cells wide.
+    """
+    blocks = np.ones((2 * n_rows + 1, 2 * n_cols + 1))
+    visited = np.zeros((n_rows, n_cols), dtype=bool)
+
+    stack = [(0, 0)]
+    visited[0, 0] = True
+    blocks[1, 1] = 0.0
+    while stack:
+        r, c = stack[-1]
+        neighbours = [(r + dr, c + dc) for dr, dc in ((1, 0), (-1, 0), (0, 1), (0, -1))
+                      if 0 <= r + dr < n_rows and 0 <= c + dc < n_cols and not visited[r + dr, c + dc]]
+        if not neighbours:
+            stack.pop()
+            continue
+        nr, nc = neighbours[rng.integers(len(neighbours))]
+        visited[nr, nc] = True
+        blocks[2 * nr + 1, 2 * nc + 1] = 0.0
+        blocks[r + nr + 1, c + nc + 1] = 0.0
+        stack.append((nr, nc))
+
+    costMap = np.kron(blocks, np.ones((corridor, corridor)))
+    return scenario("maze", costMap, resolution)
+
+
+def room_scenario():
+    # same likelihood field as planner.initTrajectoryPlanner
+    m_utilites = gridMap(laser_sig=0.4)
+    costMap = m_utilites.make_likelihood_field()
+    return scenario("room", costMap, m_utilites.getResolution())
+
+
+def run_a_star(world, start, goal, rng):
+    stats = {}
+    path = search(world.costMap, world.position_2_cell(start), world.position_2_cell(goal), 1, stats)
+
+    if path is None:
+        return None, stats.get("expansions", 0)
+
+    # a_star gives up with a partial path after too many iterations
+    if tuple(path[-1]) != world.position_2_cell(goal):
+        return None, stats["expansions"]
+
+    return [world.cell_2_position(cell) for cell in path], stats["expansions"]
+
+
+def run_theta_star(world, start, goal, rng):
+    stats = {}
+    path = theta_star_for(world.costMap).search(world.position_2_cell(start), world.position_2_cell(goal), stats)
+
+    if path is None:
+        return None, stats["expansions"]
+
+    return [world.cell_2_position(cell) for cell in path], stats["expansions"]
+
+
+def run_rrt_connect(world, start, goal, rng):
+    rrt_connect = RRTConnect(start=start, goal=goal, rand_area=RAND_AREA, obstacle_list=world.obstacle_list,
+                             expand_dis=1, robot_radius=ROBOT_RADIUS, max_iter=1000, path_resolution=1, rng=rng)
+    path = rrt_connect.planning(animation=False)
+    return path, len(rrt_connect.start_tree) + len(rrt_connect.goal_tree)
+
+
+def run_rrt_star(world, start, goal, rng):
+    rrt_star = RRTStar(start=start, goal=goal, rand_area=RAND_AREA, obstacle_list=world.obstacle_list,
+                       expand_dis=1, robot_radius=ROBOT_RADIUS, max_iter=1000, connect_circle_dist=40.0,
+                       goal_sample_rate=30, path_resolution=1, rng=rng)
+    path = rrt_star.planning(animation=False)
+    return path, len(rrt_star.node_list)
+
+
+# name: (function, needs circle obstacles)
+PLANNERS = {
+    "a_star": (run_a_star, False),
+    "theta_star": (run_theta_star, False),
+    "rrt_connect": (run_rrt_connect, True),
+    "rrt_star": (run_rrt_star, True),
+}
+
+SCENARIOS = ["obstacles_1", "obstacles_2", "random_circles", "maze", "room"]
+
+
+def make_scenario(name, rng):
+    if name == "obstacles_1":
+        return circle_scenario(name, OBSTACLE_LIST_1)
+    if name == "obstacles_2":
+        return circle_scenario(name, OBSTACLE_LIST_2)
+    if name == "random_circles":
+        return random_circles_scenario(rng)
+    if name == "maze":
+        return maze_scenario(rng)
+    if name == "room":
+        return room_scenario()
+    raise ValueError(f"unknown scenario {name}")
+
+
+def path_length(path):
+    return float(sum(math.dist(p, q) for p, q in zip(path[:-1], path[1:])))
+
+
+def run_once(function, world, start, goal, seed, measure_memory):
+    rng = np.random.default_rng(seed)
+
+    # the planners print their progress, keep the benchmark output readable
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if not measure_memory:
+            start_time = time.perf_counter()
+            path, expansions = function(world, start, goal, rng)
+            return path, expansions, time.perf_counter() - start_time
+
+        tracemalloc.start()
+        function(world, start, goal, rng)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak
+
+
+def run_benchmark(planners, scenarios, trials, seed, measure_memory=True):
+    runs = []
+
+    for scenario_name in scenarios:
+        # keyed by the scenario, so that running a subset of the scenarios gives the same maps and pairs
+        scenario_seed = np.random.SeedSequence([seed, SCENARIOS.index(scenario_name)])
+        rng = np.random.default_rng(scenario_seed)
+        world = make_scenario(scenario_name, rng)
+        pairs = [(world.random_free_position(rng), world.random_free_position(rng)) for _ in range(trials)]
+        trial_seeds = [int(s.generate_state(1)[0]) for s in scenario_seed.spawn(trials)]
+
+        for planner_name in planners:
+            function, needs_circles = PLANNERS[planner_name]
+            if needs_circles and world.obstacle_list is None:
+                continue
+
+            for trial, ((start, goal), trial_seed) in enumerate(zip(pairs, trial_seeds)):
+                path, expansions, wall_time = run_once(function, world, start, goal, trial_seed, False)
+
+                # the same seed replays the same search, tracemalloc slows it down so it is timed separately
+                peak = run_once(function, world, start, goal, trial_seed, True) if measure_memory else None
+
+                runs.append({
+                    "planner": planner_name,
+                    "scenario": scenario_name,
+                    "trial": trial,
+                    "start": start,
+                    "goal": goal,
+                    "success": path is not None,
+                    "wall_time_s": wall_time,
+                    "expansions": int(expansions),
+                    "peak_memory_kb": None if peak is None else peak / 1024,
+                    "path_length_m": path_length(path) if path is not None else None,
+                    "waypoints": len(path) if path is not None else 0,
+                })
+                print(f"{planner_name:12s} {scenario_name:15s} trial {trial}: "
+                      f"success={path is not None} time={wall_time:.3f}s expansions={expansions}")
+
+    return runs
+
+
+def summarize(runs):
+    summary = []
+    keys = sorted({(run["planner"], run["scenario"]) for run in runs})
+
+    for planner_name, scenario_name in keys:
+        group = [run for run in runs if run["planner"] == planner_name and run["scenario"] == scenario_name]
+        times = np.array([run["wall_time_s"] for run in group])
+        lengths = [run["path_length_m"] for run in group if run["success"]]
+        memory = [run["peak_memory_kb"] for run in group if run["peak_memory_kb"] is not None]
+
+        summary.append({
+            "planner": planner_name,
+            "scenario": scenario_name,
+            "runs": len(group),
+            "success_rate": sum(run["success"] for run in group) / len(group),
+            "median_time_s": float(np.median(times)),
+            "p90_time_s": float(np.percentile(times, 90)),
+            "mean_expansions": float(np.mean([run["expansions"] for run in group])),
+            "max_peak_memory_kb": max(memory) if memory else None,
+            "mean_path_length_m": float(np.mean(lengths)) if lengths else None,
+        })
+
+    return summary
+
+
+def compare(summary, baseline_summary, tolerance):
+    """
+    Returns the list of regressions: slower median time (beyond tolerance) or lower success rate.
+    """
+    baseline = {(row["planner"], row["scenario"]): row for row in baseline_summary}
+    regressions = []
+
+    for row in summary:
+        old = baseline.get((row["planner"], row["scenario"]))
+        if old is None:
+            continue
+        if row["median_time_s"] > (1 + tolerance) * old["median_time_s"]:
+            regressions.append(f"{row['planner']} on {row['scenario']}: median time "
+                               f"{old['median_time_s']:.4f}s -> {row['median_time_s']:.4f}s")
+        if row["success_rate"] < old["success_rate"]:
+            regressions.append(f"{row['planner']} on {row['scenario']}: success rate "
+                               f"{old['success_rate']:.2f} -> {row['success_rate']:.2f}")
+
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="benchmark the path planners")
+    parser.add_argument('--planners', nargs='+', default=list(PLANNERS), choices=list(PLANNERS))
+    parser.add_argument('--scenarios', nargs='+', default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument('--trials', type=int, default=5, help='start/goal pairs per scenario')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc replay of every run')
+    parser.add_argument('--output', type=str, default="benchmark_results.json")
+    parser.add_argument('--compare', type=str, default=None, help='results file of a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown for --compare')
+
+    args = parser.parse_args()
+
+    runs = run_benchmark(args.planners, args.scenarios, args.trials, args.seed, not args.no_memory)
+    summary = summarize(runs)
+
+    results = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "summary": summary,
+        "runs": runs,
+    }
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    for row in summary:
+        print(f"{row['planner']:12s} {row['scenario']:15s} success={row['success_rate']:.2f} "
+              f"median={row['median_time_s']:.4f}s expansions={row['mean_expansions']:.0f}")
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+
+        regressions = compare(summary, baseline["summary"], args.tolerance)
+        for regression in regressions:
+            print("REGRESSION:", regression, file=sys.stderr)
+
+        sys.exit(1 if regressions else 0)
@@ -33,14 +33,84 @@ class controller:
 
 
         return linear_vel, angular_vel
+
+    def save_logs(self):
+        self.PID_angular.logger.save_log()
+        self.PID_linear.logger.save_log()
     
 
+class pathTracker:
+    """
+    Keeps the path as arrays (points, segment lengths, cumulative arc length) and the
+    progress of the robot along it. Every query only projects the pose on the next
+    `window` segments after the current progress, so the cost per tick does not depend
+    on the path length and the progress never moves backwards, even on self-crossing paths.
+    """
+
+    def __init__(self, lookAhead=1.0, window=20):
+        self.lookAhead=lookAhead
+        self.window=window
+        self.source=None
+
+    def setPath(self, listGoals):
+        self.source=listGoals
+        self.points=np.asarray(listGoals, dtype=float).reshape(len(listGoals), -1)[:, :2]
+
+        self.segments=np.diff(self.points, axis=0)
+        self.lengths=np.linalg.norm(self.segments, axis=1)
+        self.arc=np.concatenate(([0.0], np.cumsum(self.lengths)))
+
+        # index of the segment the robot is on, only moves forward
+        self.index=0
+
+    def progress(self, pose):
+        """
+        Arc length of the projection of the pose on the path, searched in the window after the current segment.
+        """
+        end=min(self.index + self.window, len(self.segments))
+
+        starts=self.points[self.index:end]
+        segments=self.segments[self.index:end]
+        lengths_sq=np.maximum(self.lengths[self.index:end]**2, 1e-12)
+
+        t=np.clip(np.sum((np.array([pose[0], pose[1]]) - starts) * segments, axis=1) / lengths_sq, 0.0, 1.0)
+        projections=starts + t[:, None] * segments
+        closest=int(np.argmin(np.sum((projections - np.array([pose[0], pose[1]]))**2, axis=1)))
+
+        self.index+=closest
+        return self.arc[self.index] + t[closest] * self.lengths[self.index]
+
+    def pointsAt(self, arcLengths):
+        """
+        Points of the path at the given arc lengths (clipped to the path), as an (N, 2) array.
+        """
+        return np.column_stack((np.interp(arcLengths, self.arc, self.points[:, 0]),
+                                np.interp(arcLengths, self.arc, self.points[:, 1])))
+
+    def lookAheadPoint(self, pose, listGoals):
+
+        if listGoals is not self.source:
+            self.setPath(listGoals)
+
+        if len(self.segments) == 0:
+            return listGoals[-1]
+
+        target=min(self.progress(pose) + self.lookAhead, self.arc[-1])
+
+        # the segment containing the target, interpolated along it
+        i=min(int(np.searchsorted(self.arc, target, side='right')) - 1, len(self.segments) - 1)
+        t=(target - self.arc[i]) / self.lengths[i] if self.lengths[i] > 0 else 0.0
+
+        return (self.points[i] + t * self.segments[i]).tolist()
+
+
 class trajectoryController(controller):
 
     def __init__(self, klp=0.2, klv=0.2, kli=0.2, kap=0.2, kav=0.2, kai=0.2, lookAhead=1.0, targetVel=1.0):
         super().__init__(klp, klv, kli, kap, kav, kai)
         self.lookAhead=lookAhead
         self.targetVelocity=targetVel
+        self.tracker=pathTracker(lookAhead)
     
     def vel_request(self, pose, listGoals, status):
         
@@ -65,11 +135,5 @@ class trajectoryController(controller):
 
     def lookFarFor(self, pose, listGoals):
         
-        poseArray=np.array([pose[0], pose[1]]) 
-        listGoalsArray=np.array(listGoals)
-
-        distanceSquared=np.sum((listGoalsArray-poseArray)**2,
-                               axis=1)
-        closestIndex=np.argmin(distanceSquared)
-
-        return listGoals[ min(closestIndex + 1, len(listGoals) - 1) ]
+        # the path is cached by the tracker until listGoals is replaced by a new plan
+        return self.tracker.lookAheadPoint(pose, listGoals)
@@ -0,0 +1,363 @@
+'''
+The map model of mapManipulator without ROS: reading the pgm/yaml map, the cell <-> world
+conversions, the likelihood field and the scan scoring on it. mapManipulator adds the
+node and the OccupancyGrid message on top of it, offline tools (replay, benchmarks)
+can use gridMap directly without rclpy.
+'''
+
+import numpy as np
+from math import floor
+
+
+def distance_transform(occupied):
+    """
+    Exact euclidean distance (in cells) from every cell to the closest occupied cell, cells
+    that cannot see any occupied cell get a large distance.
+    """
+    # scipy is only needed for the map fields, its exact EDT is linear in the number of cells
+    from scipy.ndimage import distance_transform_edt
+
+    occupied = np.asarray(occupied, dtype=bool)
+    if not occupied.any():
+        return np.full(occupied.shape, float(sum(occupied.shape)))
+
+    return distance_transform_edt(~occupied)
+
+
+class gridMap:
+
+
+    def __init__(self, filename_: str = "room.yaml", laser_sig=0.1, rng=None):
+        
+        filenameYaml=None
+        filenamePGM=None
+        if ".pgm" in filename_:
+            
+            filenamePGM=filename_
+            filenameYaml=filename_.replace(".pgm", ".yaml")
+            
+        elif ".yaml" in filename_:
+            
+            filenameYaml=filename_
+            filenamePGM=filename_.replace(".yaml", ".pgm")
+        
+        else:
+            filenameYaml=filename_ + ".yaml"
+            filenamePGM=filename_+".pgm"
+
+        
+
+        width, height, max_value, pixels = self.read_pgm(filenamePGM)
+
+
+        self.width = width
+        self.height = height
+        
+        
+        
+
+        self.image_array = np.array(pixels).reshape((height, width))
+        self.o_x, self.o_y, self.res, self.thresh = self.read_description(filenameYaml)
+
+        self.laser_sig=laser_sig
+        # likelihood fields of other laser_sig, see likelihood_field_for
+        self.fields={}
+
+        # numpy.random.Generator for the localization particles
+        self.rng=np.random.default_rng() if rng is None else rng
+
+        
+    def getAllObstacles(self):
+        image_array=self.image_array.T
+
+        
+        
+        
+        indices = np.where(image_array < 10)
+        
+        return self.cells_2_positions(np.column_stack(indices))
+
+    def getLikelihoodField(self):
+        return self.likelihood_field
+    
+    def getMetaData(self):
+        return self.o_x, self.o_y, self.res, self.thresh
+            
+    def getMap(self):
+        return self.image_array
+    
+    def read_pgm(self, filename):
+        with open(filename, 'rb') as f:
+            # Check if it's a PGM file
+            header = f.readline().decode().strip()
+            
+            if header != 'P5':
+                raise ValueError('Invalid PGM file format')
+
+            # Skip comments
+            line = f.readline().decode().strip()
+            while line.startswith('#'):
+                line = f.readline().decode().strip()
+
+            # Read width, height, and maximum gray value
+            width, height = map(int, line.split())
+            max_value = int(f.readline().decode().strip())
+
+            # Read the image data
+            image_data = f.read()
+
+        # Convert image data to a list of pixel values
+        pixels = [x for x in image_data]
+
+        return width, height, max_value, pixels
+
+    def plot_pgm_image(self, image_array):
+        import matplotlib.pyplot as plt
+
+        # Convert pixel values to a NumPy array
+
+
+        # Plot the image
+        plt.imshow(image_array, cmap='gray')
+        plt.axis('off')
+        plt.title('PGM Image')
+        plt.show()
+
+
+
+    def read_description(self, filenameYAML):
+        import re
+
+        # Open and read the YAML file
+        with open(filenameYAML, 'r') as file:
+            yaml_content = file.readlines()
+
+            # Extract the desired fields
+            threshold = None
+            origin_x = None
+            origin_y = None
+            resolution = None
+
+            for line in yaml_content:
+                if 'occupied_thresh' in line:
+                    threshold = float(re.findall(r'\d+\.\d+', line)[0])
+                elif 'origin' in line:
+                    origin_values = re.findall(r'-?\d+\.\d+', line)
+                    origin_x = float(origin_values[0])
+                    origin_y = float(origin_values[1])
+                elif 'resolution' in line:
+                    resolution = float(re.findall(r'\d+\.\d+', line)[0])
+        return origin_x, origin_y, resolution, threshold
+
+
+    def getOrigin(self):
+        return np.array([self.o_x, self.o_y])
+    
+    def getResolution(self):
+        return self.res
+    
+    def cell_2_position(self, pix):
+        i,j= pix
+        return self.o_x + i*self.getResolution(),    (self.height - j) * self.getResolution()  + self.o_y  
+    
+    
+    def position_2_cell(self, pos):
+        x,y = pos
+        return floor( (-self.o_x + x)/self.getResolution()), -floor( -self.height + (-self.o_y + y)/self.getResolution() )
+
+    def cells_2_positions(self, cells):
+        """
+        World positions (N, 2) of the (N, 2) cells (i, j), same as cell_2_position.
+        """
+        cells = np.asarray(cells, dtype=float).reshape(-1, 2)
+        return np.column_stack((self.o_x + cells[:, 0]*self.res, (self.height - cells[:, 1])*self.res + self.o_y))
+
+    def positions_2_cells(self, points):
+        """
+        Cells (i, j) of the (N, 2) world points as an (N, 2) int array, same as position_2_cell,
+        and the mask of the cells inside the map (the image is indexed [j, i]).
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        cells = np.empty((len(points), 2), dtype=int)
+        cells[:, 0] = np.floor((points[:, 0] - self.o_x) / self.res)
+        cells[:, 1] = -np.floor(-self.height + (points[:, 1] - self.o_y) / self.res)
+
+        inside = (cells[:, 0] >= 0) & (cells[:, 0] < self.width) & (cells[:, 1] >= 0) & (cells[:, 1] < self.height)
+        return cells, inside
+
+
+    def make_likelihood_field(self):
+        
+        image_array=self.image_array
+
+        # the cells are on a regular grid of step res, the distance of every cell to the
+        # closest occupied one is the euclidean distance transform of the occupancy
+        dists=distance_transform(image_array < 10) * self.getResolution()
+        self.distances=dists
+        self.fields={}
+        probabilities=np.exp( -(dists**2) / (2*self.laser_sig**2))
+        
+        likelihood_field=probabilities.reshape(image_array.shape)
+        
+        likelihood_field_img=np.array(255-255*probabilities.reshape(image_array.shape), dtype=np.int32)
+        
+        self.likelihood_img=likelihood_field_img
+        
+        self.occ_points=self.getAllObstacles()
+        
+                
+        #self.plot_pgm_image(likelihood_field_img)
+
+        self.likelihood_field = likelihood_field
+
+        return likelihood_field
+                
+    
+    def likelihood_field_for(self, laser_sig):
+        """
+        Likelihood field of the map for another laser_sig, e.g. a wider one for a coarse alignment.
+        """
+        if laser_sig not in self.fields:
+            self.fields[laser_sig]=np.exp( -(self.distances**2) / (2*laser_sig**2))
+        return self.fields[laser_sig]
+
+    def likelihood_at(self, points, outside=1.0, field=None):
+        """
+        Likelihood field values at the (N, 2) world points, at the cells (i, j) of position_2_cell.
+        The field has the layout of the image, j is its row. Points outside the map get the outside value.
+        """
+        field = self.likelihood_field if field is None else field
+        cells, inside = self.positions_2_cells(points)
+
+        values = np.full(len(cells), outside, dtype=float)
+        values[inside] = field[cells[inside, 1], cells[inside, 0]]
+        return values
+
+    def calculate_score(self,x,y):
+        """
+        Likelihood at the world points (x, y), scalars or arrays of the same shape, 0 outside the map.
+        """
+        x, y = np.broadcast_arrays(x, y)
+        return self.likelihood_at(np.column_stack((x.ravel(), y.ravel())), outside=0.0).reshape(x.shape)
+
+    def occupied_at(self, points, outside=True):
+        """
+        Whether the (N, 2) world points fall on occupied cells of the map, same cells as likelihood_at.
+        """
+        cells, inside = self.positions_2_cells(points)
+
+        occupied = np.full(len(cells), outside, dtype=bool)
+        occupied[inside] = self.image_array[cells[inside, 1], cells[inside, 0]] < 10
+        return occupied
+
+    def raycast(self, pose, angles, range_max, step=None):
+        """
+        Ranges of the beams from pose=[x, y, theta] at the given angles (relative to theta) to the
+        first occupied cell, marched every step (half a cell by default). Beams that hit nothing get inf.
+        """
+        step = self.res / 2 if step is None else step
+        distances = np.arange(step, range_max + step, step)
+
+        directions = pose[2] + np.asarray(angles, dtype=float)
+        samples = np.stack((pose[0] + distances[None, :] * np.cos(directions)[:, None],
+                            pose[1] + distances[None, :] * np.sin(directions)[:, None]), axis=2)
+
+        hits = self.occupied_at(samples.reshape(-1, 2)).reshape(samples.shape[:2])
+
+        ranges = np.full(len(directions), np.inf)
+        hit = np.any(hits, axis=1)
+        ranges[hit] = distances[np.argmax(hits[hit], axis=1)]
+        return ranges
+
+    def scan_score(self, pose, points):
+        """
+        Mean likelihood of the (N, 2) scan points (robot frame) seen from pose=[x, y, theta].
+        """
+        c, s = np.cos(pose[2]), np.sin(pose[2])
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        world = np.column_stack((points[:, 0] * c - points[:, 1] * s + pose[0],
+                                 points[:, 0] * s + points[:, 1] * c + pose[1]))
+        if len(world) == 0:
+            return 0.0
+        return float(np.mean(self.likelihood_at(world, outside=0.0)))
+
+    def interpolate_at(self, points, outside=0.0, field=None):
+        """
+        Bilinear interpolation of the likelihood field (or field) between the cell centres at the (N, 2)
+        world points, and its analytic gradient (N, 2) in world coordinates. Points without four cells
+        around them get the outside value and a zero gradient.
+        """
+        field = self.likelihood_field if field is None else field
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        rows, cols = field.shape
+
+        # continuous cell coordinates, integer at the cell centres, v grows down the image like j
+        u = (points[:, 0] - self.o_x) / self.res - 0.5
+        v = self.height + 0.5 - (points[:, 1] - self.o_y) / self.res
+        i = np.floor(u).astype(int)
+        j = np.floor(v).astype(int)
+
+        inside = (i >= 0) & (i < cols - 1) & (j >= 0) & (j < rows - 1)
+        i, j, fu, fv = i[inside], j[inside], (u - np.floor(u))[inside], (v - np.floor(v))[inside]
+
+        f00 = field[j, i]
+        f10 = field[j, i + 1]
+        f01 = field[j + 1, i]
+        f11 = field[j + 1, i + 1]
+
+        values = np.full(len(points), outside, dtype=float)
+        values[inside] = (1 - fu) * (1 - fv) * f00 + fu * (1 - fv) * f10 + (1 - fu) * fv * f01 + fu * fv * f11
+
+        gradients = np.zeros((len(points), 2))
+        gradients[inside, 0] = ((1 - fv) * (f10 - f00) + fv * (f11 - f01)) / self.res
+        gradients[inside, 1] = -((1 - fu) * (f01 - f00) + fu * (f11 - f10)) / self.res
+
+        return values, gradients
+
+    def refine_poses(self, poses, points, iterations=20, tolerance=1e-4, damping=1e-3, field=None):
+        """
+        Gauss-Newton (Levenberg-Marquardt damped) scan to map alignment of the (K, 3) poses at once:
+        minimizes sum (1 - likelihood)**2 of the (N, 2) scan points (robot frame) over [x, y, theta]
+        with the interpolated field. Returns the refined poses (K, 3) and their mean likelihoods (K,).
+        """
+        poses = np.array(poses, dtype=float).reshape(-1, 3)
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        damping = np.full(len(poses), damping)
+
+        def transform(poses):
+            c, s = np.cos(poses[:, 2])[:, None], np.sin(poses[:, 2])[:, None]
+            rotated = np.stack((points[:, 0] * c - points[:, 1] * s, points[:, 0] * s + points[:, 1] * c), axis=2)
+            return rotated + poses[:, None, :2], rotated
+
+        def residuals(poses):
+            world, rotated = transform(poses)
+            values, gradients = self.interpolate_at(world.reshape(-1, 2), field=field)
+            return 1.0 - values.reshape(world.shape[:2]), gradients.reshape(world.shape), rotated
+
+        r, gradients, rotated = residuals(poses)
+        cost = np.sum(r**2, axis=1)
+
+        for _ in range(iterations):
+            # d world / d theta is the rotated point turned by 90 degrees
+            J = -np.stack((gradients[:, :, 0], gradients[:, :, 1],
+                           gradients[:, :, 1] * rotated[:, :, 0] - gradients[:, :, 0] * rotated[:, :, 1]), axis=2)
+
+            H = np.einsum('kna,knb->kab', J, J)
+            g = np.einsum('kna,kn->ka', J, r)
+            H += damping[:, None, None] * (np.eye(3) * np.diagonal(H, axis1=1, axis2=2)[:, None, :] + 1e-9 * np.eye(3))
+            step = -np.linalg.solve(H, g[:, :, None])[:, :, 0]
+
+            new_r, new_gradients, new_rotated = residuals(poses + step)
+            new_cost = np.sum(new_r**2, axis=1)
+
+            better = new_cost < cost
+            poses[better] += step[better]
+            r[better], gradients[better], rotated[better], cost[better] = \
+                new_r[better], new_gradients[better], new_rotated[better], new_cost[better]
+            damping = np.where(better, damping / 3, damping * 5)
+
+            if np.all(np.abs(step) < tolerance) or np.all(~better & (damping > 1e6)):
+                break
+
+        poses[:, 2] = np.arctan2(np.sin(poses[:, 2]), np.cos(poses[:, 2]))
+        return poses, 1.0 - np.mean(r, axis=1)
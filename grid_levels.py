@@ -0,0 +1,152 @@
+'''
+Multi-resolution planning on the costmap grid.
+
+gridLevels keeps max pooled copies of one costmap (a_star.max_pool), a coarse cell is
+as expensive as the worst cell it covers, so a path that is free on a coarse level is
+free at full resolution as well. search plans on the coarse level first, then runs the
+full resolution A* again only inside a corridor of a few coarse cells around the
+coarse path, which is a small fraction of the map. If the coarse level closes a
+passage (checked up front on its connected components) or the corridor is too tight,
+it falls back to the full resolution search. The price of the speed up is that the
+path follows the coarse one, it can go around a gap that only the full resolution
+grid has.
+
+The levels are built on first use and the gridLevels of a costmap are cached by its
+content, like the fields of a_star.distance_fields_for.
+'''
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from a_star import search, max_pool, costmap_key
+
+
+class gridLevels:
+
+    def __init__(self, costMap, threshold=0.8):
+        self.costMap = np.asarray(costMap)
+        self.threshold = threshold
+        self.levels = {1: self.costMap}
+        self.labels = {}
+        self.lock = threading.Lock()
+
+    def level(self, factor):
+        with self.lock:
+            if factor not in self.levels:
+                self.levels[factor] = max_pool(self.costMap, factor)
+            return self.levels[factor]
+
+    def components(self, factor):
+        """
+        Connected components (8-connected, like the moves of search) of the free cells of a level.
+        """
+        from scipy.ndimage import label
+
+        coarse = self.level(factor)
+        with self.lock:
+            if factor not in self.labels:
+                self.labels[factor] = label(coarse <= self.threshold, structure=np.ones((3, 3)))[0]
+            return self.labels[factor]
+
+    def connected(self, start, end, factor):
+        """
+        Whether the coarse cells of start and end (cleared by search) touch a common free component.
+        """
+        labels = self.components(factor)
+
+        def touching(cell):
+            row, col = cell[1] // factor, cell[0] // factor
+            window = labels[max(row - 1, 0):row + 2, max(col - 1, 0):col + 2]
+            return set(window[window > 0].tolist())
+
+        return bool(touching(start) & touching(end))
+
+    def corridor(self, coarse_path, factor, margin=1):
+        """
+        Full resolution mask (costMap layout) of the coarse cells within margin of coarse_path.
+        """
+        coarse = self.level(factor)
+        # the cells of search are indexed in costMap.T
+        mask = np.zeros(coarse.shape[::-1], dtype=bool)
+        rows, cols = np.array(coarse_path).T
+        mask[rows, cols] = True
+
+        grown = mask.copy()
+        for d_row in range(-margin, margin + 1):
+            for d_col in range(-margin, margin + 1):
+                shifted = np.roll(mask, (d_row, d_col), axis=(0, 1))
+                # np.roll wraps around, the wrapped rows and columns are cleared
+                if d_row > 0: shifted[:d_row] = False
+                if d_row < 0: shifted[d_row:] = False
+                if d_col > 0: shifted[:, :d_col] = False
+                if d_col < 0: shifted[:, d_col:] = False
+                grown |= shifted
+
+        full = np.repeat(np.repeat(grown.T, factor, axis=0), factor, axis=1)
+        return full[:self.costMap.shape[0], :self.costMap.shape[1]]
+
+    def search(self, start, end, factor=1, margin=1, stats=None, cancel_event=None, costMap=None):
+        """
+        Full resolution path start -> end (cells like a_star.search), planned on the level factor
+        and refined in the corridor around it. None if there is no path or cancel_event was set.
+        costMap: the costmap of these levels with more obstacles (e.g. localCostmap.overlay), the
+        refinement and the full search run on it, the coarse path is only a guide.
+        """
+        costMap = self.costMap if costMap is None else costMap
+        start = tuple(int(v) for v in start)
+        end = tuple(int(v) for v in end)
+        expansions = 0
+
+        # a coarse search that cannot succeed costs as much as the full one, it is skipped
+        if factor > 1 and self.connected(start, end, factor):
+            coarse = self.level(factor).copy()
+            # the start and the goal are often next to a wall, their coarse cells are only a guide
+            coarse[start[1] // factor, start[0] // factor] = 0.0
+            coarse[end[1] // factor, end[0] // factor] = 0.0
+
+            coarse_stats = {}
+            coarse_path = search(coarse, (start[0] // factor, start[1] // factor),
+                                 (end[0] // factor, end[1] // factor), 1, coarse_stats, cancel_event)
+            expansions += coarse_stats.get("expansions", 0)
+
+            if coarse_path is not None and tuple(coarse_path[-1]) == (end[0] // factor, end[1] // factor):
+                corridor = self.corridor(coarse_path, factor, margin)
+                refine_stats = {}
+                path = search(np.where(corridor, costMap, 1.0), start, end, 1, refine_stats, cancel_event)
+                expansions += refine_stats.get("expansions", 0)
+
+                if path is not None and tuple(path[-1]) == end:
+                    if stats is not None:
+                        stats["expansions"] = expansions
+                    return path
+
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+
+        full_stats = {}
+        path = search(costMap, start, end, 1, full_stats, cancel_event)
+        if stats is not None:
+            stats["expansions"] = expansions + full_stats.get("expansions", 0)
+
+        if path is None or tuple(path[-1]) != end:
+            return None
+        return path
+
+
+GRID_LEVELS = OrderedDict()
+MAX_CACHED_MAPS = 4
+
+
+def grid_levels_for(costMap, threshold=0.8):
+
+    key = costmap_key(costMap, threshold)
+
+    if key not in GRID_LEVELS:
+        GRID_LEVELS[key] = gridLevels(costMap, threshold)
+        while len(GRID_LEVELS) > MAX_CACHED_MAPS:
+            GRID_LEVELS.popitem(last=False)
+
+    GRID_LEVELS.move_to_end(key)
+    return GRID_LEVELS[key]
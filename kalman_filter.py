@@ -89,3 +89,122 @@ class kalman_filter:
             [0,0,0  , v, w, 0],
         ])
         
+
+
+
+class fast_kalman_filter(kalman_filter):
+    """
+    Same model as kalman_filter, but without per-call array allocations:
+
+    - the Jacobians and all the intermediate products are written in preallocated buffers,
+      A only changes in 6 entries
+    - H only has non zero entries in the w, v, vdot columns (3:6), so only that 4x3
+      block is kept and the products with H only touch those columns of P
+    - the gain is computed with a Cholesky solve of S instead of inv(S), in place in the
+      buffer of P H^T
+    - the covariance uses the Joseph form, which keeps P symmetric positive definite
+    - x and P are updated in place
+    """
+
+    # columns of the state vector that the measurements depend on
+    MEASURED=slice(3, 6)
+
+    def __init__(self, P, Q, R, x):
+
+        # scipy is only needed by this filter, LAPACK posv factorizes and solves in one call
+        from scipy.linalg.lapack import dposv
+        self.posv=dposv
+
+        super().__init__(np.array(P, dtype=float), np.array(Q, dtype=float),
+                         np.array(R, dtype=float), np.array(x, dtype=float))
+
+        n=self.x.shape[0]
+
+        self.A=np.eye(n)
+        self.H_block=np.zeros((self.R.shape[0], 3))
+        #                   w  v  vdot
+        self.H_block[0]=[0, 1, 0]
+        self.H_block[1]=[1, 0, 0]
+        self.H_block[2]=[0, 0, 1]
+
+        m=self.R.shape[0]
+        self.identity=np.eye(n)
+        self.I_KH=np.eye(n)
+        self.AP=np.empty((n, n))
+        self.PHt=np.empty((n, m))
+        self.S=np.empty((m, m))
+        self.KH=np.empty((n, 3))
+        self.KR=np.empty((n, m))
+        self.dx=np.empty(n)
+        self.innovation=np.empty(m)
+
+    def predict(self, dt):
+
+        self.dt=dt
+
+        x, y, th, w, v, vdot=self.x
+        c, s=np.cos(th), np.sin(th)
+
+        # Jacobian of the motion model at the current state, only the non constant entries change
+        self.A[0, 2]=-v*s*dt
+        self.A[0, 4]=c*dt
+        self.A[1, 2]=v*c*dt
+        self.A[1, 4]=s*dt
+        self.A[2, 3]=dt
+        self.A[4, 5]=dt
+
+        # motion model, in place
+        self.x[0]=x + v*c*dt
+        self.x[1]=y + v*s*dt
+        self.x[2]=th + w*dt
+        self.x[4]=v + vdot*dt
+
+        np.dot(self.A, self.P, out=self.AP)
+        np.dot(self.AP, self.A.T, out=self.P)
+        self.P+=self.Q
+
+    def update(self, z):
+
+        x, y, th, w, v, vdot=self.x
+
+        # the last row of H is the Jacobian of v*w
+        self.H_block[3, 0]=v
+        self.H_block[3, 1]=w
+
+        np.dot(self.P[:, self.MEASURED], self.H_block.T, out=self.PHt)
+        np.dot(self.H_block, self.PHt[self.MEASURED], out=self.S)
+        self.S+=self.R
+
+        # K = P H^T S^-1, solved as S K^T = (P H^T)^T with a Cholesky factorization of S (LAPACK posv).
+        # The transposes are Fortran ordered views (S is symmetric), so posv overwrites PHt with K
+        kalman_gain=self.PHt
+        _, _, info=self.posv(self.S.T, self.PHt.T, overwrite_a=1, overwrite_b=1)
+        if info != 0:
+            # S is only positive semi definite, e.g. with a zero R: S was overwritten, it is built again
+            np.dot(self.P[:, self.MEASURED], self.H_block.T, out=self.PHt)
+            S=np.dot(self.H_block, self.PHt[self.MEASURED]) + self.R
+            kalman_gain=np.linalg.solve(S, self.PHt.T).T
+
+        self.innovation[0]=z[0] - v
+        self.innovation[1]=z[1] - w
+        self.innovation[2]=z[2] - vdot
+        self.innovation[3]=z[3] - v*w
+
+        np.dot(kalman_gain, self.innovation, out=self.dx)
+        self.x+=self.dx
+
+        # Joseph form: P = (I - KH) P (I - KH)^T + K R K^T
+        np.copyto(self.I_KH, self.identity)
+        np.dot(kalman_gain, self.H_block, out=self.KH)
+        self.I_KH[:, self.MEASURED]-=self.KH
+
+        np.dot(self.I_KH, self.P, out=self.AP)
+        np.dot(self.AP, self.I_KH.T, out=self.P)
+        np.dot(kalman_gain, self.R, out=self.KR)
+        np.dot(self.KR, kalman_gain.T, out=self.AP)
+        self.P+=self.AP
+
+    def jacobian_H(self):
+        H=np.zeros((self.R.shape[0], self.x.shape[0]))
+        H[:, self.MEASURED]=self.H_block
+        return H
@@ -16,7 +16,7 @@ from geometry_msgs.msg import Pose, PointStamped, Quaternion, Point
 class map_utilities(Node):
 
 
-    def __init__(self, laser_sig=0.1, filename_="room.pgm", yaml_filename_="room.yaml"):
+    def __init__(self, laser_sig=0.1, filename_="room.pgm", yaml_filename_="room.yaml", rng=None):
         
         
         filename = filename_
@@ -28,6 +28,9 @@ class map_utilities(Node):
         self.o_x, self.o_y, self.res, self.thresh = self.read_description(yaml_filename)
 
         self.laser_sig=laser_sig
+
+        # numpy.random.Generator for the localization particles
+        self.rng=np.random.default_rng() if rng is None else rng
         
         self.likelihood_msg=None
         
@@ -189,9 +192,9 @@ class map_utilities(Node):
         num_particles = 1000
 
         # Generate random particles within the given range
-        particles_x = np.random.uniform(x_min, x_max, num_particles)
-        particles_y = np.random.uniform(y_min, y_max, num_particles)
-        particles_theta = np.random.uniform(theta_min, theta_max, num_particles)
+        particles_x = self.rng.uniform(x_min, x_max, num_particles)
+        particles_y = self.rng.uniform(y_min, y_max, num_particles)
+        particles_theta = self.rng.uniform(theta_min, theta_max, num_particles)
         
         # Transform points using each particle
         max_score=-1000
@@ -232,13 +235,13 @@ class map_utilities(Node):
 
                 print(weighted_std)
                 
-                particles_x = np.random.normal(weighted_avg[0], 0.2, num_particles)
-                particles_y = np.random.uniform(weighted_avg[1], 0.2, num_particles)
-                particles_theta = np.random.uniform(weighted_avg[2], 0.2, num_particles)
+                particles_x = self.rng.normal(weighted_avg[0], 0.2, num_particles)
+                particles_y = self.rng.normal(weighted_avg[1], 0.2, num_particles)
+                particles_theta = self.rng.normal(weighted_avg[2], 0.2, num_particles)
             else:
-                particles_x = np.random.uniform(x_min, x_max, num_particles)
-                particles_y = np.random.uniform(y_min, y_max, num_particles)
-                particles_theta = np.random.uniform(theta_min, theta_max, num_particles)        
+                particles_x = self.rng.uniform(x_min, x_max, num_particles)
+                particles_y = self.rng.uniform(y_min, y_max, num_particles)
+                particles_theta = self.rng.uniform(theta_min, theta_max, num_particles)        
 
         plt.plot(tx, ty, '*')
         plt.plot(self.occ_points[:,0], self.occ_points[:,1], '.')
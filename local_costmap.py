@@ -0,0 +1,261 @@
+'''
+Local obstacle layer: a rolling window costmap of what the laser sees, centred on the robot.
+
+The static costmap only has the walls of room.pgm. localCostmap keeps the obstacles of
+the live scans in a fixed size (n, n) int8 grid of occupancy evidence:
+
+    - the grid is a ring buffer, the world cell (gx, gy) (gx = floor(x / resolution)) is
+      stored at [gx % n, gy % n]. When the robot moves the window is only shifted: the
+      rows/columns that leave it are zeroed (they are the ones the entering cells reuse),
+      nothing is copied or reallocated
+    - every scan is ray traced at once: the cells along all the beams are cleared (-miss)
+      and the cells of the endpoints are marked (+hit), evidence is clipped to [0, max_value]
+    - the cost of a point is the likelihood field of the occupied cells of the window,
+      exp(-d**2 / (2 laser_sig**2)) like gridMap.make_likelihood_field, computed once per
+      scan. merged() and overlay() take the max with the static costmap, for the MPC
+      rollouts and for replanning on the grid planners.
+    - version is incremented whenever the set of occupied cells changes, so a failed
+      replan is not retried on every scan while the obstacles stay the same
+
+Beams without a return (inf, 0 or beyond range_max) are dropped by convertScanToCartesian,
+so they do not clear anything.
+'''
+
+import threading
+
+import numpy as np
+
+from gridMap import distance_transform
+from utilities import convertScanToCartesian
+
+
+class localCostmap:
+
+    def __init__(self, width=4.0, resolution=0.05, laser_sig=0.4, hit=60, miss=20, max_value=100, occupied=50):
+        """
+        width: side of the window (m), resolution: its cell size (m)
+        laser_sig: spread of the cost around the occupied cells, like the static likelihood field
+        hit, miss: evidence added by an endpoint, removed by a beam going through the cell
+        occupied: evidence from which a cell is an obstacle
+        """
+        self.resolution=resolution
+        self.size=int(round(width / resolution))
+        self.laser_sig=laser_sig
+        self.hit=hit
+        self.miss=miss
+        self.max_value=max_value
+        self.occupied=occupied
+
+        self.grid=np.zeros((self.size, self.size), dtype=np.int8)
+        # world cell of the lower left corner of the window, None until the first update
+        self.origin=None
+        self.costs=None
+        self.version=0
+        self.lock=threading.Lock()
+
+    def recenter(self, x, y):
+        """
+        Moves the window so that (x, y) is in its centre, the cells leaving it are cleared.
+        """
+        origin=np.floor(np.array([x, y]) / self.resolution).astype(int) - self.size // 2
+
+        if self.origin is None:
+            self.origin=origin
+            return
+
+        for axis in range(2):
+            shift=int(origin[axis] - self.origin[axis])
+            if shift == 0:
+                continue
+
+            if abs(shift) >= self.size:
+                if np.any(self.grid >= self.occupied):
+                    self.version+=1
+                self.grid[:]=0
+                break
+
+            # the cells leaving the window, the entering ones are stored in the same rows/columns
+            leaving=self.origin[axis] + (np.arange(shift) if shift > 0 else self.size + np.arange(shift, 0))
+            leaving=(leaving % self.size, slice(None)) if axis == 0 else (slice(None), leaving % self.size)
+            if np.any(self.grid[leaving] >= self.occupied):
+                self.version+=1
+            self.grid[leaving]=0
+
+        self.origin=origin
+        self.costs=None
+
+    def window_cells(self, points):
+        """
+        Cells of the (N, 2) world points relative to the window origin, and the mask of the ones inside it.
+        """
+        cells=np.floor(np.asarray(points, dtype=float).reshape(-1, 2) / self.resolution).astype(int) - self.origin
+        inside=np.all((cells >= 0) & (cells < self.size), axis=1)
+        return cells, inside
+
+    def storage_index(self, cells):
+        """
+        Flat index in self.grid of the (N, 2) window cells.
+        """
+        storage=(cells + self.origin) % self.size
+        return storage[:, 0] * self.size + storage[:, 1]
+
+    def update(self, pose, laserScan):
+        """
+        Adds the scan (a LaserScan or replay.scanSample) seen from pose=[x, y, theta].
+        """
+        points, _=convertScanToCartesian(laserScan)
+        self.update_points(pose, points)
+
+    def update_points(self, pose, points):
+        """
+        Adds the (N, 2) scan endpoints (robot frame) seen from pose=[x, y, theta].
+        """
+        x, y, theta=pose[0], pose[1], pose[2]
+        points=np.asarray(points, dtype=float).reshape(-1, 2)
+
+        c, s=np.cos(theta), np.sin(theta)
+        directions=points @ np.array([[c, s], [-s, c]])
+        ranges=np.linalg.norm(points, axis=1)
+
+        with self.lock:
+            self.recenter(x, y)
+
+            # samples every half cell along all the beams, up to one cell before the endpoint
+            step=0.5 * self.resolution
+            t=np.arange(int(np.ceil(np.max(ranges, initial=0.0) / step))) * step
+            along=t[None, :] < ranges[:, None] - self.resolution
+            unit=directions / np.maximum(ranges, 1e-9)[:, None]
+            samples=np.array([x, y]) + unit[:, None, :] * t[None, :, None]
+
+            cleared=np.zeros(self.size * self.size, dtype=bool)
+            cells, inside=self.window_cells(samples[along])
+            cleared[self.storage_index(cells[inside])]=True
+
+            hits=np.zeros(self.size * self.size, dtype=bool)
+            cells, inside=self.window_cells(directions + np.array([x, y]))
+            hits[self.storage_index(cells[inside])]=True
+
+            cleared&=~hits
+
+            evidence=self.grid.reshape(-1)
+            touched=cleared | hits
+            was_occupied=evidence[touched] >= self.occupied
+
+            evidence[cleared]=np.maximum(evidence[cleared].astype(np.int16) - self.miss, 0)
+            evidence[hits]=np.minimum(evidence[hits].astype(np.int16) + self.hit, self.max_value)
+
+            if np.any((evidence[touched] >= self.occupied) != was_occupied):
+                self.version+=1
+
+            self.costs=None
+
+    def window(self):
+        """
+        The evidence in window order, [0, 0] is the cell at the origin.
+        """
+        return np.roll(self.grid, tuple(-self.origin % self.size), axis=(0, 1))
+
+    def cost_field(self):
+        # under self.lock, recomputed after every update or shift
+        if self.costs is None:
+            dists=distance_transform(self.window() >= self.occupied) * self.resolution
+            self.costs=np.exp(-(dists**2) / (2*self.laser_sig**2))
+        return self.costs
+
+    def cost_at(self, points):
+        """
+        Cost in [0, 1] of the (N, 2) world points, 0 outside the window or before the first scan.
+        """
+        points=np.asarray(points, dtype=float).reshape(-1, 2)
+        costs=np.zeros(len(points))
+
+        with self.lock:
+            if self.origin is None:
+                return costs
+
+            cells, inside=self.window_cells(points)
+            costs[inside]=self.cost_field()[cells[inside, 0], cells[inside, 1]]
+
+        return costs
+
+    def obstacles(self):
+        """
+        World centres (N, 2) of the occupied cells of the window.
+        """
+        with self.lock:
+            if self.origin is None:
+                return np.empty((0, 2))
+            cells=np.argwhere(self.window() >= self.occupied)
+            return (cells + self.origin + 0.5) * self.resolution
+
+    def merged(self, costLookup=None):
+        """
+        Function (N, 2) world points -> (N,) cost, the max of costLookup (e.g. the static
+        likelihood field) and of this layer, for mpcController.
+        """
+        if costLookup is None:
+            return self.cost_at
+        return lambda points: np.maximum(costLookup(points), self.cost_at(points))
+
+    def map_box(self, grid_map, shape):
+        """
+        (i_min, i_max, j_min, j_max), the half open ranges of the cells of grid_map (a costmap of
+        shape, indexed [j, i]) whose centres can be in the window. None before the first scan
+        or when the window is off the map.
+        """
+        with self.lock:
+            if self.origin is None:
+                return None
+            corners=np.array([self.origin, self.origin + self.size]) * self.resolution
+
+        (i_min, j_max), (i_max, j_min)=grid_map.positions_2_cells(corners)[0]
+        i_min, i_max=max(i_min, 0), min(i_max + 1, shape[1])
+        j_min, j_max=max(j_min, 0), min(j_max + 1, shape[0])
+        if i_min >= i_max or j_min >= j_max:
+            return None
+        return i_min, i_max, j_min, j_max
+
+    def overlay_box(self, costMap, grid_map, box):
+        """
+        Copy of the block costMap[j_min:j_max, i_min:i_max] of box with the cost of this layer on it.
+        """
+        i_min, i_max, j_min, j_max=box
+        block=np.array(costMap[j_min:j_max, i_min:i_max], dtype=float)
+
+        jj, ii=np.mgrid[j_min:j_max, i_min:i_max]
+        centres=grid_map.cells_2_positions(np.column_stack((ii.ravel(), jj.ravel()))) + 0.5 * grid_map.getResolution()
+        return np.maximum(block, self.cost_at(centres).reshape(block.shape))
+
+    def overlay(self, costMap, grid_map):
+        """
+        Copy of costMap (the likelihood field of grid_map, indexed [j, i]) with the cost of this
+        layer on the cells of the window, for the grid planners.
+        """
+        costMap=np.array(costMap, dtype=float)
+
+        box=self.map_box(grid_map, costMap.shape)
+        if box is not None:
+            i_min, i_max, j_min, j_max=box
+            costMap[j_min:j_max, i_min:i_max]=self.overlay_box(costMap, grid_map, box)
+        return costMap
+
+    def blocked(self, path):
+        """
+        True if the polyline path (world points) crosses an occupied cell of the window.
+        """
+        path=np.asarray(path, dtype=float).reshape(-1, 2)
+        if len(path) < 2:
+            return False
+
+        segments=np.diff(path, axis=0)
+        counts=np.maximum(np.ceil(np.linalg.norm(segments, axis=1) / (0.5 * self.resolution)).astype(int), 1)
+        segment=np.repeat(np.arange(len(segments)), counts)
+        fraction=(np.arange(len(segment)) - np.repeat(np.cumsum(counts) - counts, counts)) / counts[segment]
+        samples=np.vstack((path[segment] + fraction[:, None] * segments[segment], path[-1:]))
+
+        with self.lock:
+            if self.origin is None:
+                return False
+            cells, inside=self.window_cells(samples)
+            cells=cells[inside]
+            return bool(np.any(self.window()[cells[:, 0], cells[:, 1]] >= self.occupied))
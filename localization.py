@@ -1,5 +1,4 @@
 import sys
-import time
 from utilities import Logger
 
 from rclpy.time import Time
@@ -13,7 +12,7 @@ from rclpy.qos import QoSProfile
 from nav_msgs.msg import Odometry as odom
 
 from sensor_msgs.msg import Imu
-from kalman_filter import kalman_filter
+from sensor_fusion import fusionPipeline, odom_imu_measurement
 
 from rclpy import init, spin, spin_once
 
@@ -43,8 +42,6 @@ class localization(Node):
             print("We don't have this type for localization", sys.stderr)
             return            
     
-        self.timelast=time.time()
-    
     def initRawSensors(self):
         self.create_subscription(odom, "/odom", self.odom_callback, qos_profile=odom_qos)
 
@@ -56,47 +53,33 @@ class localization(Node):
         time_syncher=message_filters.ApproximateTimeSynchronizer([self.odom_sub, self.imu_sub], queue_size=10, slop=0.1)
         
         time_syncher.registerCallback(self.fusion_callback)
+
+        self.fusion=fusionPipeline(logger=self.loc_logger)
         
     
     def fusion_callback(self, odom_msg: odom, imu_msg: Imu):
 
+        stamp=max(Time.from_msg(odom_msg.header.stamp).nanoseconds, Time.from_msg(imu_msg.header.stamp).nanoseconds)
+
         if not self.kalmanInitialized:
-            x=np.array([odom_msg.pose.pose.position.x,
-                        odom_msg.pose.pose.position.y,
-                        euler_from_quaternion(odom_msg.pose.pose.orientation),
-                        0,
-                        0,
-                        0])        
-
-            Q = 0.3*np.eye(N=6)
-            R = 0.1*np.eye(N=4)
-            P = 1*np.eye(N=6)
-            
-            self.kf=kalman_filter(P,Q,R, x)
+            self.fusion.initialize(odom_msg.pose.pose.position.x,
+                                   odom_msg.pose.pose.position.y,
+                                   euler_from_quaternion(odom_msg.pose.pose.orientation),
+                                   stamp)
             self.kalmanInitialized = True
-        
-        dt = time.time() - self.timelast
 
-        self.timelast=time.time()
+        # dt comes from the message stamps, the measurement is fused once it leaves the reorder buffer
+        fused=self.fusion.add_measurement(stamp, odom_imu_measurement(odom_msg, imu_msg))
 
+        if fused == 0:
+            return
 
-        z=np.array([odom_msg.twist.twist.linear.x,
-                    odom_msg.twist.twist.angular.z,
-                    imu_msg.linear_acceleration.x,
-                    imu_msg.linear_acceleration.y])
-        # print(dt)
-        self.kf.predict(dt)
-        self.kf.update(z)
-        
-        xhat=self.kf.get_states()
-        
-        self.pose=np.array([xhat[0],
-                            xhat[1],
-                            normalize_angle(xhat[2]),
-                            odom_msg.header.stamp])
-        
-        
-        self.loc_logger.log_values([z[2], z[3], xhat[5], xhat[4]*xhat[3], xhat[4], xhat[3], xhat[0], xhat[1], Time.from_msg(imu_msg.header.stamp).nanoseconds])
+        x, y, theta, fused_stamp=self.fusion.getPose()
+
+        self.pose=np.array([x,
+                            y,
+                            theta,
+                            Time(nanoseconds=fused_stamp).to_msg()])
         
         # print(f"{xhat[0]} and {xhat[1]} vs {odom_msg.pose.pose.position.x} vs {odom_msg.pose.pose.position.y}")
     def odom_callback(self, pose_msg):
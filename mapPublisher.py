@@ -1,31 +1,24 @@
 import rclpy
-from rclpy.node import Node
-from nav_msgs.msg import OccupancyGrid
 from tf2_ros.static_transform_broadcaster import StaticTransformBroadcaster
 from geometry_msgs.msg import TransformStamped
 
-from mapUtilities import *
+from mapServer import tiledMapServer
 
 
-def timerCallback():
-    Publisher.publish(occGrid)
-
 if __name__ == "__main__":
 
     rclpy.init()
 
-    map_ = mapManipulator()
-
-    node = Node("mapPublisher")
-
-    Publisher = node.create_publisher(OccupancyGrid, "/customMap", 10)
+    # publishes the full map once (latched) on /customMap and only the changed tiles
+    # on /customMap_updates afterwards, the obstacles of /scan around the robot included
+    map_ = tiledMapServer(topic="/customMap", scan_topic="/scan")
 
     # Create a static transform broadcaster
-    static_broadcaster = StaticTransformBroadcaster(node)
+    static_broadcaster = StaticTransformBroadcaster(map_)
 
     # Create an identity transform (no translation or rotation)
     static_transform_stamped = TransformStamped()
-    static_transform_stamped.header.stamp = node.get_clock().now().to_msg()
+    static_transform_stamped.header.stamp = map_.get_clock().now().to_msg()
     static_transform_stamped.header.frame_id = "map"
     static_transform_stamped.child_frame_id = "odom"
 
@@ -42,10 +35,4 @@ if __name__ == "__main__":
     # Send the transform
     static_broadcaster.sendTransform(static_transform_stamped)
 
-    map_.make_likelihood_field()
-
-    occGrid = map_.to_message()
-
-    node.create_timer(1.0, timerCallback)
-
-    rclpy.spin(node)
+    rclpy.spin(map_)
@@ -0,0 +1,144 @@
+'''
+Tiled map server: the full OccupancyGrid is published once (latched), after that only
+the tiles that changed are sent as map_msgs/OccupancyGridUpdate messages on
+<topic>_updates, which is also what RViz listens to.
+
+The occupancy (in the same [0, 100] int8 encoding and row major layout as
+mapManipulator.to_message) is kept as a numpy array. Every write compares the new
+values with the current ones and marks the tiles that actually changed as dirty; the
+update timer sends one OccupancyGridUpdate per dirty tile. The full grid is only
+republished, on a slow timer, when it went stale, so that subscribers joining late
+get the current map.
+
+With a scan_topic the published field is the static one merged with a
+local_costmap.localCostmap of the scans (at the pose of /odom, the map -> odom transform
+of mapPublisher is the identity), so only the tiles around the robot are ever sent.
+'''
+
+import numpy as np
+from array import array
+
+from rclpy.qos import QoSProfile, QoSDurabilityPolicy
+from nav_msgs.msg import OccupancyGrid
+from nav_msgs.msg import Odometry
+from sensor_msgs.msg import LaserScan
+from map_msgs.msg import OccupancyGridUpdate
+
+from mapUtilities import mapManipulator
+from local_costmap import localCostmap
+from utilities import euler_from_quaternion
+
+
+class tiledMapServer(mapManipulator):
+
+    def __init__(self, filename_: str = "room.yaml", laser_sig=0.1, topic="/customMap", tile_size=32,
+                 update_period=1.0, full_refresh_period=60.0, scan_topic=None, odom_topic="/odom"):
+
+        super().__init__(filename_, laser_sig)
+
+        self.tile_size = tile_size
+
+        map_qos = QoSProfile(depth=1, durability=QoSDurabilityPolicy.TRANSIENT_LOCAL)
+        self.full_publisher = self.create_publisher(OccupancyGrid, topic, map_qos)
+        self.update_publisher = self.create_publisher(OccupancyGridUpdate, topic + "_updates", 10)
+
+        self.make_likelihood_field()
+        grid = self.to_message()
+
+        # message frame: grid.info.height rows of grid.info.width cells
+        self.occupancy = np.frombuffer(grid.data, dtype=np.int8).reshape(grid.info.height, grid.info.width).copy()
+
+        n_tile_rows = -(-self.occupancy.shape[0] // tile_size)
+        n_tile_cols = -(-self.occupancy.shape[1] // tile_size)
+        self.dirty_tiles = np.zeros((n_tile_rows, n_tile_cols), dtype=bool)
+        self.full_stale = False
+
+        self.full_publisher.publish(grid)
+
+        self.create_timer(update_period, self.publish_updates)
+        self.create_timer(full_refresh_period, self.refresh_full_map)
+
+        self.local_layer = None
+        self.pose = None
+        if scan_topic is not None:
+            self.local_layer = localCostmap(laser_sig=laser_sig)
+            sensor_qos = QoSProfile(reliability=2, durability=2, history=1, depth=10)
+            self.create_subscription(Odometry, odom_topic, self.odom_callback, qos_profile=sensor_qos)
+            self.create_subscription(LaserScan, scan_topic, self.scan_callback, qos_profile=sensor_qos)
+
+    def odom_callback(self, msg):
+        self.pose = [msg.pose.pose.position.x, msg.pose.pose.position.y, euler_from_quaternion(msg.pose.pose.orientation)]
+
+    def scan_callback(self, msg):
+
+        if self.pose is None:
+            return
+
+        shape = self.likelihood_field.shape
+        left = self.local_layer.map_box(self, shape)
+        self.local_layer.update(self.pose, msg)
+        window = self.local_layer.map_box(self, shape)
+
+        # only the cells of the window and the ones it just left (back to the static field, which
+        # is never changed) are recomputed, update_cells sends the tiles that changed
+        for box in dict.fromkeys(box for box in (left, window) if box is not None):
+            i_min, _, j_min, _ = box
+            block = self.local_layer.overlay_box(self.likelihood_field, self, box)
+            self.update_cells(i_min, j_min, np.clip(block.T * 100, 0, 100).astype(np.int8))
+
+    def update_cells(self, row, col, values):
+        """
+        Writes a block of int8 occupancy values (message frame) with its top left corner at (row, col)
+        and marks the tiles with changed cells as dirty.
+        """
+        values = np.asarray(values, dtype=np.int8)
+        block = self.occupancy[row:row + values.shape[0], col:col + values.shape[1]]
+        values = values[:block.shape[0], :block.shape[1]]
+
+        changed_rows, changed_cols = np.nonzero(block != values)
+        if len(changed_rows) == 0:
+            return
+
+        block[...] = values
+        self.dirty_tiles[(changed_rows + row) // self.tile_size, (changed_cols + col) // self.tile_size] = True
+        self.full_stale = True
+
+    def publish_updates(self):
+
+        if not np.any(self.dirty_tiles):
+            return
+
+        stamp = self.get_clock().now().to_msg()
+
+        for tile_row, tile_col in zip(*np.nonzero(self.dirty_tiles)):
+            row, col = tile_row * self.tile_size, tile_col * self.tile_size
+            tile = self.occupancy[row:row + self.tile_size, col:col + self.tile_size]
+
+            update = OccupancyGridUpdate()
+            update.header.stamp = stamp
+            update.header.frame_id = "map"
+            update.x = int(col)
+            update.y = int(row)
+            update.width = tile.shape[1]
+            update.height = tile.shape[0]
+            update.data = array('b', tile.tobytes())
+
+            self.update_publisher.publish(update)
+
+        self.dirty_tiles[:] = False
+
+    def refresh_full_map(self):
+
+        # late subscribers only get the latched full map, keep it in sync with the updates
+        if not self.full_stale:
+            return
+
+        # a new message, the cached one of to_message stays the static map
+        grid = OccupancyGrid()
+        grid.header.stamp = self.get_clock().now().to_msg()
+        grid.header.frame_id = "map"
+        grid.info = self.to_message().info
+        grid.data = array('b', self.occupancy.tobytes())
+
+        self.full_publisher.publish(grid)
+        self.full_stale = False
@@ -0,0 +1,144 @@
+'''
+Sampling based model predictive controller (MPPI) for the unicycle model.
+
+On every call thousands of control sequences (v, w) over the horizon are sampled
+around the current nominal sequence, all of them are rolled out at once with numpy,
+and each rollout is scored against:
+
+    - the reference: the path points the robot should be at on each step when moving
+      at v_ref along the path (arc length parameterized, from controller.pathTracker)
+    - the costmap: the likelihood field of the map (close to 1 next to obstacles),
+      looked up through costLookup for all the rollout points in one call
+    - the control effort and the change of the controls between steps
+
+The new nominal sequence is the exponentially weighted average of the samples
+(MPPI), its first control is applied and the sequence is shifted by one step for
+the next call (warm start).
+
+mpcController has the same vel_request(pose, goal, status) interface as controller
+and trajectoryController, so decision_maker can use it as a drop in replacement.
+'''
+
+import numpy as np
+
+from controller import pathTracker
+
+
+class mpcController:
+
+    def __init__(self, horizon=20, dt=0.1, samples=2000, v_max=0.3, w_max=1.5, v_ref=0.25,
+                 v_std=0.1, w_std=0.6, temperature=1.0, tracking_weight=5.0, obstacle_weight=20.0,
+                 effort_weight=0.1, smoothness_weight=0.5, costLookup=None, rng=None):
+        """
+        horizon, dt: number of steps and step size of the rollouts
+        samples: number of control sequences evaluated per call
+        v_max, w_max: limits of the linear and angular velocity, v >= 0
+        v_ref: speed at which the reference moves along the path
+        v_std, w_std: standard deviation of the sampled perturbations
+        temperature: MPPI lambda, lower values trust the best rollouts more
+        costLookup: function (N, 2) world points -> (N,) cost in [0, 1], e.g. mapManipulator.likelihood_at
+        rng: numpy.random.Generator for the samples
+        """
+        self.horizon=horizon
+        self.dt=dt
+        self.samples=samples
+        self.v_max=v_max
+        self.w_max=w_max
+        self.v_ref=v_ref
+        self.noise_std=np.array([v_std, w_std])
+        self.temperature=temperature
+
+        self.tracking_weight=tracking_weight
+        self.obstacle_weight=obstacle_weight
+        self.effort_weight=effort_weight
+        self.smoothness_weight=smoothness_weight
+
+        self.costLookup=costLookup
+        self.rng=np.random.default_rng() if rng is None else rng
+
+        self.tracker=pathTracker()
+        self.nominal=np.zeros((horizon, 2))
+        # (value, wrapped path) of the last single goal point
+        self.pointGoal=None
+
+    def rollout(self, pose, controls):
+        """
+        Integrates the unicycle model for all the control sequences (K, H, 2) at once,
+        returns the positions (K, H, 2) after each step.
+        """
+        v=controls[:, :, 0]
+        w=controls[:, :, 1]
+
+        theta=pose[2] + np.cumsum(w * self.dt, axis=1)
+        # the heading used on each step is the one before the rotation of that step
+        theta_prev=np.concatenate((np.full((len(controls), 1), pose[2]), theta[:, :-1]), axis=1)
+
+        x=pose[0] + np.cumsum(v * np.cos(theta_prev) * self.dt, axis=1)
+        y=pose[1] + np.cumsum(v * np.sin(theta_prev) * self.dt, axis=1)
+
+        return np.stack((x, y), axis=2)
+
+    def reference(self, pose, listGoals):
+        """
+        Where the robot should be after each step of the horizon, (H, 2).
+        """
+        if listGoals is not self.tracker.source:
+            self.tracker.setPath(listGoals)
+            self.nominal[:]=0.0
+
+        if len(self.tracker.segments) == 0:
+            return np.repeat(self.tracker.points[-1:], self.horizon, axis=0)
+
+        progress=self.tracker.progress(pose)
+        steps=progress + self.v_ref * self.dt * np.arange(1, self.horizon + 1)
+        return self.tracker.pointsAt(steps)
+
+    def cost(self, positions, controls, reference):
+
+        cost=self.tracking_weight * np.sum(np.sum((positions - reference[None, :, :])**2, axis=2), axis=1)
+
+        if self.costLookup is not None:
+            obstacle=self.costLookup(positions.reshape(-1, 2)).reshape(positions.shape[:2])
+            cost+=self.obstacle_weight * np.sum(obstacle, axis=1)
+
+        cost+=self.effort_weight * np.sum(controls[:, :, 1]**2, axis=1)
+        cost+=self.smoothness_weight * np.sum(np.sum(np.diff(controls, axis=1)**2, axis=2), axis=1)
+
+        return cost
+
+    def vel_request(self, pose, listGoals, status):
+
+        if not status:
+            return 0.0, 0.0
+
+        # a single goal point, as used by the point planner. The same wrapped path is reused while
+        # the goal is unchanged, a new one would reset the tracker and the warm start on every call
+        if np.ndim(listGoals[0]) == 0:
+            if self.pointGoal is None or not np.array_equal(self.pointGoal[0], listGoals):
+                self.pointGoal=(list(listGoals), [listGoals])
+            listGoals=self.pointGoal[1]
+
+        reference=self.reference(pose, listGoals)
+
+        noise=self.rng.normal(size=(self.samples, self.horizon, 2)) * self.noise_std
+        controls=self.nominal[None, :, :] + noise
+        controls[:, :, 0]=np.clip(controls[:, :, 0], 0.0, self.v_max)
+        controls[:, :, 1]=np.clip(controls[:, :, 1], -self.w_max, self.w_max)
+
+        costs=self.cost(self.rollout(pose, controls), controls, reference)
+
+        weights=np.exp(-(costs - np.min(costs)) / self.temperature)
+        weights/=np.sum(weights)
+
+        self.nominal=np.tensordot(weights, controls, axes=1)
+
+        velocity, yaw_rate=self.nominal[0]
+
+        # warm start of the next call
+        self.nominal=np.roll(self.nominal, -1, axis=0)
+        self.nominal[-1]=self.nominal[-2]
+
+        return float(velocity), float(yaw_rate)
+
+    def save_logs(self):
+        pass
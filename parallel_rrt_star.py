@@ -0,0 +1,106 @@
+'''
+Runs several independent RRT* searches in parallel, one per RNG seed, and keeps
+the best (or the first) path.
+
+RRT* results vary a lot from one seed to another, so with idle cores it is cheaper
+to run K searches side by side than to run one search for longer. Every worker
+builds its own RRTStar from the same parameters and gives it a numpy Generator
+created from its own seed, so for a given set of seeds the BEST_COST mode always
+returns the same path. In FIRST_FOUND mode the first path to come back wins,
+which depends on scheduling, and the remaining workers are told to stop through
+a shared event. The same event stops all of them when the cancel_event of the caller
+(e.g. the one of a planning_service request) is set.
+'''
+
+import contextlib
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from rrt_star import RRTStar
+
+BEST_COST=0; FIRST_FOUND=1
+
+# set in every worker process by _init_worker
+_cancel_event = None
+
+
+def path_length(path):
+    return sum(math.dist(p, q) for p, q in zip(path[:-1], path[1:]))
+
+
+def _init_worker(cancel_event):
+    global _cancel_event
+    _cancel_event = cancel_event
+
+
+def _plan_with_seed(rrt_star_params, seed):
+    rrt_star = RRTStar(**rrt_star_params, rng=np.random.default_rng(seed))
+    rrt_star.cancel_event = _cancel_event
+
+    # RRTStar prints every iteration, K workers doing it at once would flood the console
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        path = rrt_star.planning(animation=False)
+
+    return seed, path
+
+
+def parallel_rrt_star_planning(rrt_star_params, seeds, mode=BEST_COST, max_workers=None, cancel_event=None,
+                               poll_period=0.05):
+    """
+    rrt_star_params: dict with the keyword arguments of RRTStar
+    seeds: list of seeds, one RRTStar is run for each of them
+    mode: BEST_COST waits for all the workers and returns the shortest path,
+          FIRST_FOUND returns the first path found and cancels the other workers
+    max_workers: size of the process pool, defaults to min(len(seeds), cpu count)
+    cancel_event: threading.Event, polled every poll_period seconds, once it is set the workers
+                  are stopped and (None, None) is returned
+
+    Returns (path, seed) of the selected search, or (None, None) if none found a path.
+    """
+    seeds = list(seeds)
+    if max_workers is None:
+        max_workers = min(len(seeds), os.cpu_count() or 1)
+
+    stop_event = multiprocessing.Event()
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(stop_event,)) as pool:
+
+        pending = {pool.submit(_plan_with_seed, rrt_star_params, seed) for seed in seeds}
+        results = {}
+
+        while pending:
+            done, pending = wait(pending, timeout=None if cancel_event is None else poll_period,
+                                 return_when=FIRST_COMPLETED)
+
+            if cancel_event is not None and cancel_event.is_set():
+                stop_event.set()
+                for other in pending:
+                    other.cancel()
+                return None, None
+
+            for future in done:
+                seed, path = future.result()
+                results[seed] = path
+
+                if mode == FIRST_FOUND and path is not None:
+                    stop_event.set()
+                    for other in pending:
+                        other.cancel()
+                    return path, seed
+
+    # keep the order of seeds for the ties, so that the selection does not depend on timing
+    best_path, best_seed, best_cost = None, None, float("inf")
+    for seed in seeds:
+        path = results.get(seed)
+        if path is None:
+            continue
+        cost = path_length(path)
+        if cost < best_cost:
+            best_path, best_seed, best_cost = path, seed, cost
+
+    return best_path, best_seed
@@ -0,0 +1,214 @@
+'''
+Post-processing of planned paths: shortcutting followed by curvature-bounded spline smoothing.
+
+The planners return either a list of grid cells (a_star) or the vertices of a tree
+branch (RRT family). Both have many redundant waypoints and sharp corners. Here:
+
+1. shortcut_path removes waypoints as long as the straight segment that replaces
+   them is collision free (greedy farthest-visible or randomized pairs).
+2. spline_smooth_path fits a smoothing B-spline through the shortcut path,
+   resamples it at a fixed arc length and only accepts it if every sample and every
+   segment between samples is collision free and the curvature stays below the bound.
+   Otherwise the shortcut polyline resampled at the same arc length is returned, which
+   is collision free by construction.
+
+Collision checks go through a checker object, so the same code works on the circle
+obstacles used by the RRTs and on the costmap used by a_star. All the checks are
+done for a batch of segments at once.
+'''
+
+import numpy as np
+
+GREEDY_SHORTCUT=0; RANDOM_SHORTCUT=1
+
+
+class circleCollisionChecker:
+    """
+    Collision checker for the [(x, y, radius), ...] obstacle lists of the RRT planners.
+    """
+
+    def __init__(self, obstacle_list, robot_radius=0.0, resolution=0.1):
+        obstacles = np.array(obstacle_list, dtype=float).reshape(-1, 3)
+        self.centers = obstacles[:, :2]
+        self.radii_sq = (obstacles[:, 2] + robot_radius)**2
+        self.resolution = resolution
+
+    def points_free(self, points):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        d_sq = np.sum((points[:, None, :] - self.centers[None, :, :])**2, axis=2)
+        # the RRTs consider touching the inflated obstacle as a collision too
+        return np.all(d_sq > self.radii_sq[None, :], axis=1)
+
+    def segments_free(self, starts, ends):
+        return _segments_free(self, starts, ends)
+
+
+class gridCollisionChecker:
+    """
+    Collision checker for paths expressed in cells of the costmap, as returned by a_star.search.
+    The cells are indexed like in a_star, maze = costMap.T, and a cell is blocked
+    when its cost is above threshold.
+    """
+
+    def __init__(self, costMap, threshold=0.8, resolution=0.25):
+        self.blocked = np.asarray(costMap).T > threshold
+        self.resolution = resolution
+
+    def points_free(self, points):
+        cells = np.rint(np.asarray(points, dtype=float).reshape(-1, 2)).astype(int)
+        inside = (cells[:, 0] >= 0) & (cells[:, 0] < self.blocked.shape[0]) & \
+                 (cells[:, 1] >= 0) & (cells[:, 1] < self.blocked.shape[1])
+
+        free = np.zeros(len(cells), dtype=bool)
+        free[inside] = ~self.blocked[cells[inside, 0], cells[inside, 1]]
+        return free
+
+    def segments_free(self, starts, ends):
+        return _segments_free(self, starts, ends)
+
+
+def _segments_free(checker, starts, ends):
+    """
+    Samples every segment starts[k]->ends[k] every checker.resolution and checks all the
+    samples of all the segments with a single points_free call.
+    """
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+
+    if len(starts) == 0:
+        return np.ones(0, dtype=bool)
+
+    lengths = np.linalg.norm(ends - starts, axis=1)
+    n_samples = np.ceil(lengths / checker.resolution).astype(int) + 1
+
+    # all the segments are sampled with the largest count, the extra samples of the shorter
+    # segments are clipped to their end point and do not change the result
+    steps = np.arange(n_samples.max())
+    t = np.minimum(steps[None, :] / np.maximum(n_samples - 1, 1)[:, None], 1.0)
+    samples = starts[:, None, :] + t[:, :, None] * (ends - starts)[:, None, :]
+
+    free = checker.points_free(samples.reshape(-1, 2))
+    return np.all(free.reshape(len(starts), -1), axis=1)
+
+
+def path_length(path):
+    points = np.asarray(path, dtype=float)
+    return float(np.sum(np.linalg.norm(np.diff(points, axis=0), axis=1)))
+
+
+def shortcut_path(path, checker, method=GREEDY_SHORTCUT, iterations=200, rng=None):
+    """
+    Removes the waypoints that can be skipped with a collision free straight segment.
+
+    GREEDY_SHORTCUT: from each kept waypoint jump to the farthest waypoint it can see.
+    RANDOM_SHORTCUT: try iterations random pairs of waypoints and drop what is in between
+                     when they can be connected directly.
+    """
+    points = np.asarray(path, dtype=float)
+
+    if len(points) < 3:
+        return points
+
+    if method == GREEDY_SHORTCUT:
+        kept = [0]
+        i = 0
+        while i < len(points) - 1:
+            candidates = np.arange(i + 1, len(points))
+            visible = checker.segments_free(np.repeat(points[i:i + 1], len(candidates), axis=0),
+                                            points[candidates])
+            # the next waypoint is always kept if even that one is not visible
+            j = candidates[visible][-1] if np.any(visible) else i + 1
+            kept.append(j)
+            i = j
+        return points[kept]
+
+    rng = np.random.default_rng() if rng is None else rng
+
+    for _ in range(iterations):
+        if len(points) < 3:
+            break
+        i, j = np.sort(rng.choice(len(points), size=2, replace=False))
+        if j - i < 2:
+            continue
+        if checker.segments_free(points[i:i + 1], points[j:j + 1])[0]:
+            points = np.concatenate((points[:i + 1], points[j:]))
+
+    return points
+
+
+def resample_path(path, spacing):
+    """
+    Resamples a polyline at a fixed arc length, the last point is always kept.
+    """
+    points = np.asarray(path, dtype=float)
+    arc = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(points, axis=0), axis=1))))
+
+    if arc[-1] == 0.0:
+        return points[:1]
+
+    s = np.append(np.arange(0.0, arc[-1], spacing), arc[-1])
+    return np.column_stack((np.interp(s, arc, points[:, 0]), np.interp(s, arc, points[:, 1])))
+
+
+def path_curvature(points):
+    """
+    Discrete curvature at the interior points of a resampled path (Menger curvature).
+    """
+    a = points[1:-1] - points[:-2]
+    b = points[2:] - points[1:-1]
+    c = points[2:] - points[:-2]
+
+    cross = np.abs(a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0])
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) * np.linalg.norm(c, axis=1)
+
+    return np.divide(2.0 * cross, norms, out=np.zeros_like(cross), where=norms > 0)
+
+
+def spline_smooth_path(path, checker, spacing, max_curvature, smoothing_levels=(1.0, 0.3, 0.1, 0.03, 0.01, 0.0)):
+    """
+    Fits a cubic smoothing spline through the path and resamples it every spacing.
+
+    The smoothing is tried from the loosest to the tightest fit (scaled by the number of
+    points and spacing**2), the first spline that is collision free and whose curvature
+    stays under max_curvature is returned. If none qualifies the polyline itself is
+    resampled, which keeps the collision guarantee of the input path.
+    """
+    points = np.asarray(path, dtype=float)
+
+    # the spline is fitted through the densified polyline so that long segments stay straight,
+    # the densified polyline is also what is returned when no spline qualifies
+    dense = resample_path(points, spacing)
+    if len(dense) < 4:
+        return dense
+
+    from scipy.interpolate import splprep, splev
+
+    # the end points are weighted heavily so that the spline starts and ends where the path does
+    weights = np.ones(len(dense))
+    weights[[0, -1]] = 100.0
+
+    for level in smoothing_levels:
+        try:
+            tck, _ = splprep([dense[:, 0], dense[:, 1]], w=weights, s=level * len(dense) * spacing**2, k=3)
+        except ValueError:
+            continue
+
+        fine = np.column_stack(splev(np.linspace(0.0, 1.0, 10 * len(dense)), tck))
+        fine[0], fine[-1] = points[0], points[-1]
+        smooth = resample_path(fine, spacing)
+
+        if len(smooth) >= 3 and np.max(path_curvature(smooth)) > max_curvature:
+            continue
+
+        if np.all(checker.points_free(smooth)) and np.all(checker.segments_free(smooth[:-1], smooth[1:])):
+            return smooth
+
+    return dense
+
+
+def post_process_path(path, checker, spacing, max_curvature, method=GREEDY_SHORTCUT, rng=None):
+    """
+    Shortcutting followed by spline smoothing, returns the path as a list of [x, y].
+    """
+    shortcut = shortcut_path(path, checker, method, rng=rng)
+    return spline_smooth_path(shortcut, checker, spacing, max_curvature).tolist()
@@ -1,6 +1,5 @@
 
-from rclpy.time import Time
-from utilities import Logger
+from utilities import Logger, stamp_to_ns
 
 P=0
 PD=1
@@ -56,10 +55,10 @@ class PID_ctrl:
         dt_avg=0
         error_dot=0
         for i in range(1, len(self.history)):
-            t0=Time.from_msg(self.history[i-1][1])
-            t1=Time.from_msg(self.history[i][1])
+            t0=stamp_to_ns(self.history[i-1][1])
+            t1=stamp_to_ns(self.history[i][1])
             
-            dt=(t1.nanoseconds - t0.nanoseconds) / 1e9
+            dt=(t1 - t0) / 1e9
             
             dt_avg+=0.1
             dt=0.1            
@@ -80,7 +79,7 @@ class PID_ctrl:
             
         
         
-        self.logger.log_values( [latest_error, error_dot, error_int, Time.from_msg(stamp).nanoseconds])
+        self.logger.log_values( [latest_error, error_dot, error_int, stamp_to_ns(stamp)])
 
         
         
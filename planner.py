@@ -1,28 +1,201 @@
-from mapUtilities import *
+import numpy as np
+from gridMap import gridMap
 from rrt_star import RRTStar
+from rrt_connect import RRTConnect
+from parallel_rrt_star import parallel_rrt_star_planning, BEST_COST, FIRST_FOUND
+from path_processing import post_process_path, circleCollisionChecker, gridCollisionChecker
+import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from a_star import *
+from theta_star import theta_star_for
+from grid_levels import grid_levels_for
+from tour_planner import plan_tour, concatenate_legs
+from profiling import LATENCIES
 import time
 
-POINT_PLANNER=0; A_STAR_PLANNER=1; RRT_PLANNER=2; RRT_STAR_PLANNER=3
+POINT_PLANNER=0; A_STAR_PLANNER=1; RRT_PLANNER=2; RRT_STAR_PLANNER=3; PARALLEL_RRT_STAR_PLANNER=4; THETA_STAR_PLANNER=5
+
+PLANNER_NAMES={POINT_PLANNER: "point", A_STAR_PLANNER: "a_star", RRT_PLANNER: "rrt_connect",
+               RRT_STAR_PLANNER: "rrt_star", PARALLEL_RRT_STAR_PLANNER: "parallel rrt_star",
+               THETA_STAR_PLANNER: "theta_star"}
+
+OBSTACLE_LIST_1 = [
+    (5, 5, 1),
+    (3, 6, 2),
+    (3, 8, 2),
+    (3, 10, 2),
+    (7, 5, 2),
+    (9, 5, 2),
+    (8, 10, 1),
+    (6, 12, 1),
+]
+
+OBSTACLE_LIST_2 = [
+    (2, 2, 1),
+    (6, 2, 2),
+    (4, 4, 2),
+    (8, 3, 1),
+    (10, 4, 1),
+    (5, 7, 2),
+    (10, 10, 2),
+    (6, 12, 1),
+    (12, 7, 2)
+]
+
+# the circle worlds of the RRT planners, data/obstacle<k>_goal<g>.npy were planned in OBSTACLE_LISTS[k]
+OBSTACLE_LISTS={1: OBSTACLE_LIST_1, 2: OBSTACLE_LIST_2}
+
 
 class planner:
-    def __init__(self, type_, mapName="room"):
+    def __init__(self, type_, mapName="room", seeds=None, parallelMode=BEST_COST, rng=None, postProcess=True,
+                 maxGoalFields=8, scaleFactor=1):
 
         self.type=type_
         self.mapName=mapName
 
+        # shortcut and spline smooth the planned paths, see path_processing.py
+        self.postProcess=postProcess
+
+        # A* plans on the map max pooled by scaleFactor first and refines the path at full
+        # resolution around it (grid_levels.py), 1 searches the full resolution map only
+        self.scaleFactor=scaleFactor
+
+        # shared by the sampling planners, pass np.random.default_rng(seed) for reproducible runs
+        self.rng=np.random.default_rng() if rng is None else rng
+
+        # one RRT* search per seed for PARALLEL_RRT_STAR_PLANNER
+        self.seeds=list(range(os.cpu_count() or 1)) if seeds is None else list(seeds)
+        self.parallelMode=parallelMode
+
+        # cost-to-go fields of the registered goals (A*), computed in a worker thread and LRU cached
+        self.costMap=None
+        # costMap with the obstacles of localLayer on top, what the grid planners search
+        self.plannedCostMap=None
+        self.maxGoalFields=maxGoalFields
+        self.fieldWorker=ThreadPoolExecutor(max_workers=1)
+        self.pendingFields={}
+        # goals can be registered from another thread than the one planning, which rebuilds the costmap
+        self.initLock=threading.Lock()
+
+        # local_costmap.localCostmap of the live scans, merged into the costmap of the grid
+        # planners and into costLookup when set
+        self.localLayer=None
+
     
-    def plan(self, startPose=None, endPose=None):
-        
+    def plan(self, startPose=None, endPose=None, cancelEvent=None):
+        """
+        cancelEvent: threading.Event, once it is set the search stops and plan returns None.
+        """
         if self.type==POINT_PLANNER:
             return self.point_planner(endPose)
 
-        self.costMap=None
-        self.initTrajectoryPlanner()
+        with self.initLock, LATENCIES.time("planner_init"):
+            self.costMap=None
+            self.initTrajectoryPlanner()
+            # the caches of the grid planners are keyed on the static costMap, the layer is applied on top
+            self.plannedCostMap=self.costMap
+            if self.localLayer is not None and self.type in (A_STAR_PLANNER, THETA_STAR_PLANNER):
+                self.plannedCostMap=self.localLayer.overlay(self.costMap, self.m_utilites)
         
-        return self.trajectory_planner(startPose, endPose, self.type)
+        return self.trajectory_planner(startPose, endPose, self.type, cancelEvent)
+
+
+    def register_goals(self, goals):
+        """
+        Precomputes in the background the cost-to-go fields of goals (world coordinates) the
+        robot keeps returning to. A* plans to them are then a walk along the parent pointers
+        of the field, O(path length), instead of a search. Returns the future of the computation.
+        """
+        with self.initLock:
+            if self.costMap is None:
+                with LATENCIES.time("planner_init"):
+                    self.initTrajectoryPlanner()
+            costMap=self.costMap
+            cells=[self.search_cell(goal) for goal in goals]
+
+        fields=distance_fields_for(costMap, max_fields=self.maxGoalFields)
+
+        future=self.fieldWorker.submit(fields.compute, cells)
+        for cell in cells:
+            self.pendingFields[cell]=future
+        return future
+
+    def goal_field_path(self, startPose, endPose):
+        """
+        Path start -> end (cells) from the cached field of end, None if end has no field.
+        """
+        endPose=tuple(endPose)
+        future=self.pendingFields.pop(endPose, None)
+        # the fields registered with it are cached even if it failed on other goals
+        if future is not None:
+            wait([future])
+
+        fields=distance_fields_for(self.costMap, max_fields=self.maxGoalFields)
+        if not fields.cached(endPose):
+            return None
+
+        # the field is rooted at the goal, its parent pointers lead from the start to the goal
+        path=fields.path(endPose, startPose)
+        if path is None:
+            return None
+
+        # the field only knows the static map, a path through the obstacles of the local layer is searched again
+        if self.plannedCostMap is not None and self.plannedCostMap is not self.costMap:
+            cells=np.array(path)
+            if np.any(self.plannedCostMap[cells[:, 1], cells[:, 0]] > 0.8):
+                return None
+
+        return path[::-1]
+
+    def plan_tour(self, startPose, waypoints, closed=False, cancelEvent=None):
+        """
+        Path from startPose through all the waypoints, in the order with the shortest total
+        path, on the costmap of the A* planner (closed: back to startPose at the end).
+        The path is in world coordinates, like the one of plan, None if cancelEvent was set meanwhile.
+        """
+        with self.initLock, LATENCIES.time("planner_init"):
+            self.costMap=None
+            self.initTrajectoryPlanner()
+            # tours reuse the fields of the static costmap, the local layer only reaches the MPC
+            self.plannedCostMap=self.costMap
+
+        cells=[self.search_cell(pose) for pose in [startPose, *waypoints]]
+
+        with LATENCIES.time("planner_search_tour"):
+            order, legs=plan_tour(self.costMap, cells[0], cells[1:], closed, cancel_event=cancelEvent)
 
+        if cancelEvent is not None and cancelEvent.is_set():
+            print("the tour search was cancelled")
+            return None
+
+        if legs is None:
+            print("Cannot find a tour through all the waypoints")
+            return None
+
+        print(f"visiting the waypoints in the order {order}")
+
+        # every leg is post processed on its own so that no shortcut skips a waypoint
+        if self.postProcess:
+            with LATENCIES.time("planner_post_process"):
+                legs=[self.post_process(leg, A_STAR_PLANNER) for leg in legs]
+
+        return self.cells_to_world(concatenate_legs(legs))
+
+    def search_cell(self, pose):
+        """
+        Cell (i, j) of position_2_cell of the world pose, the grid searches index costMap.T with it.
+        """
+        cells, _=self.m_utilites.positions_2_cells(pose)
+        return tuple(int(v) for v in cells[0])
+
+    def cells_to_world(self, path):
+        """
+        World coordinates of the centres of the (possibly fractional) cells of a grid search path.
+        """
+        # cell i spans [i, i+1) cells along x, cell j spans (j-1, j] cells down from the top of the map
+        return (self.m_utilites.cells_2_positions(path) + np.array([0.5, 0.5]) * self.m_utilites.getResolution()).tolist()
 
     def point_planner(self, endPose):
         return endPose
@@ -30,93 +203,143 @@ class planner:
     def initTrajectoryPlanner(self):
         
         #### If using the map, you can leverage on the code below originally implemented for A* (BONUS points option)
-        self.m_utilites=mapManipulator(laser_sig=0.4)    
+        self.m_utilites=gridMap(laser_sig=0.4, rng=self.rng)    
         self.costMap=self.m_utilites.make_likelihood_field()
         
-        obstacle_list_1 = [
-        (5, 5, 1),
-        (3, 6, 2),
-        (3, 8, 2),
-        (3, 10, 2),
-        (7, 5, 2),
-        (9, 5, 2),
-        (8, 10, 1),
-        (6, 12, 1),
-        ]
-        
-        obstacle_list_2 = [
-        (2, 2, 1),
-        (6, 2, 2),
-        (4, 4, 2),
-        (8, 3, 1),
-        (10, 4, 1),
-        (5, 7, 2),
-        (10, 10, 2),
-        (6, 12, 1),
-        (12, 7, 2)
-        ]
+        self.obstacle_list=OBSTACLE_LIST_2
+        self.robot_radius=0.2
         
-        self.rrt_star = RRTStar(
+        self.rrt_star_params = dict(
             start=[0, 0],
             goal=[14, 10],
             rand_area=[-2, 15],
-            obstacle_list=obstacle_list_2,
+            obstacle_list=self.obstacle_list,
             expand_dis=1,
-            robot_radius=0.2,
+            robot_radius=self.robot_radius,
             max_iter=1000,
             connect_circle_dist=40.0,
             goal_sample_rate=30,
-            path_resolution=1
+            path_resolution=1,
+            smooth_output=not self.postProcess
+        )
+
+        self.rrt_star = RRTStar(**self.rrt_star_params, rng=self.rng)
+
+        self.rrt_connect = RRTConnect(
+            start=[0, 0],
+            goal=[14, 10],
+            rand_area=[-2, 15],
+            obstacle_list=self.obstacle_list,
+            expand_dis=1,
+            robot_radius=self.robot_radius,
+            max_iter=1000,
+            path_resolution=1,
+            rng=self.rng
         )
         
     
-    def trajectory_planner(self, startPoseCart=None, endPoseCart=None, type=None):
+    def trajectory_planner(self, startPoseCart=None, endPoseCart=None, type=None, cancelEvent=None):
         
         #### If using the map, you can leverage on the code below originally implemented for A* (BONUS points option)
         #### If not using the map (no bonus), you can just call the function in rrt_star with the appropriate arguments and get the returned path
         #### then you can put the necessary measure to bypass the map stuff down here.
         # Map scaling factor (to save planning time)
-        scale_factor = 1 # this is the downsample scale, if set 2, it will downsample the map by half, and if set x, it will do the same as 1/x
+        scale_factor = self.scaleFactor # this is the downsample scale, if set 2, it will downsample the map by half, and if set x, it will do the same as 1/x
 
         if startPoseCart and endPoseCart:
-            startPose=self.m_utilites.position_2_cell(startPoseCart)
-            endPose=self.m_utilites.position_2_cell(endPoseCart)
-            
-            startPose = [int(i/scale_factor) for i in startPose]
-            endPose   = [int(j/scale_factor) for j in endPose]
-            mazeOrigin = self.m_utilites.position_2_cell([0,0])
+            startPose=self.search_cell(startPoseCart)
+            endPose=self.search_cell(endPoseCart)
         
         start_time = time.time()
 
-        if type == A_STAR_PLANNER:
-            path = search(self.costMap, startPose, endPose, scale_factor)
-        elif type == RRT_STAR_PLANNER:
-            path = self.rrt_star.planning(animation=False)
+        path = None
+
+        self.rrt_star.cancel_event = cancelEvent
+        self.rrt_connect.cancel_event = cancelEvent
+
+        with LATENCIES.time(f"planner_search_{PLANNER_NAMES[type]}"):
+            if type == A_STAR_PLANNER:
+                path = self.goal_field_path(startPose, endPose)
+                if path is None:
+                    # planned on the max pooled map downsampled by scale_factor, refined at full resolution
+                    path = grid_levels_for(self.costMap).search(startPose, endPose, scale_factor, cancel_event=cancelEvent,
+                                                                costMap=self.plannedCostMap)
+            elif type == THETA_STAR_PLANNER:
+                path = theta_star_for(self.costMap, overlay=self.plannedCostMap).search(startPose, endPose,
+                                                                                       cancel_event=cancelEvent)
+            elif type == RRT_PLANNER:
+                path = self.rrt_connect.planning(animation=False)
+            elif type == RRT_STAR_PLANNER:
+                path = self.rrt_star.planning(animation=False)
+            elif type == PARALLEL_RRT_STAR_PLANNER:
+                path, seed = parallel_rrt_star_planning(self.rrt_star_params, self.seeds, self.parallelMode,
+                                                        cancel_event=cancelEvent)
+                if path is not None:
+                    print(f"the path of seed {seed} was selected")
         
+        if path is None and cancelEvent is not None and cancelEvent.is_set():
+            print(f"the {PLANNER_NAMES[type]} search was cancelled")
+            return None
+
         if path is None:
             print("Cannot find path")
             sys.exit(1)
 
+        if self.postProcess:
+            with LATENCIES.time("planner_post_process"):
+                path = self.post_process(path, type)
 
         end_time = time.time()
 
         # This will display how much time the search algorithm needed to find a path
-        print(f"the time took for a_star calculation was {end_time - start_time}")
-
-        # path_ = [[x*scale_factor, y*scale_factor] for x,y in path]
-        # Path = np.array(list(map(self.m_utilites.cell_2_position, path_)))
+        print(f"the time took for {PLANNER_NAMES[type]} calculation was {end_time - start_time}")
 
-        # this can be in form of a function that you can put in the utilities.py 
-        # or add it as a method to the original rrt.py 
-        path = path[::-1]
+        # the grid paths are in cells of the full resolution costmap
+        if type in (A_STAR_PLANNER, THETA_STAR_PLANNER):
+            path = self.cells_to_world(path)
+        else:
+            # the RRT planners return the path from the goal to the start
+            path = path[::-1]
         np.save(file="data/obstacle2_goal2.npy", arr=path)
         print(f"path is {path}")
         return path
 
+    def costLookup(self):
+        """
+        Function (N, 2) world points -> (N,) obstacle cost in [0, 1] for the world of the last plan,
+        used by the MPC controller to score its rollouts. None before the first plan.
+        """
+        if self.type in (A_STAR_PLANNER, THETA_STAR_PLANNER):
+            costLookup = self.m_utilites.likelihood_at
+
+        elif not hasattr(self, "obstacle_list"):
+            return None
+
+        else:
+            # the RRT planners use the virtual circle obstacles, not the map
+            checker = circleCollisionChecker(self.obstacle_list, robot_radius=self.robot_radius)
+            costLookup = lambda points: 1.0 - checker.points_free(points)
+
+        if self.localLayer is not None:
+            return self.localLayer.merged(costLookup)
+        return costLookup
+
+    def post_process(self, path, type):
+
+        # 0.3 m is the tightest turning radius we want the controller to follow
+        if type in (A_STAR_PLANNER, THETA_STAR_PLANNER):
+            # a_star and theta_star paths are in cells of the costmap
+            cell_size = self.m_utilites.getResolution()
+            checker = gridCollisionChecker(self.plannedCostMap)
+            return post_process_path(path, checker, spacing=0.25/cell_size, max_curvature=cell_size/0.3, rng=self.rng)
+
+        checker = circleCollisionChecker(self.obstacle_list, robot_radius=self.robot_radius)
+        return post_process_path(path, checker, spacing=0.25, max_curvature=1/0.3, rng=self.rng)
+
 
 if __name__=="__main__":
 
-    m_utilites=mapManipulator()
+    m_utilites=gridMap()
     
     map_likelihood=m_utilites.make_likelihood_field()
 
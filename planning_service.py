@@ -0,0 +1,133 @@
+'''
+Planning service: plan requests are run one at a time in a worker thread and their
+results are delivered through concurrent.futures.Future objects.
+
+Requests are coalesced, the latest one wins:
+
+    - a request that has not started yet when a newer one arrives is cancelled
+      (its future is cancelled without ever running)
+    - the search of the request that is running is cancelled cooperatively, the
+      threading.Event passed to it as cancelEvent is set, and a_star, theta_star,
+      grid_levels and the RRT planners check it in their loops and give up
+
+so a burst of goals clicked in RViz costs at most one search that is cut short plus
+the search of the last goal. A cancelled request's future raises CancelledError.
+
+    service=planningService()
+    future=service.submit(planner.plan, start, goal)
+    future.add_done_callback(...)
+'''
+
+import sys
+import threading
+from concurrent.futures import Future, CancelledError
+
+
+class planningService:
+
+    def __init__(self, name="planning"):
+        self.condition=threading.Condition()
+        self.pending=None
+        self.running=None
+        self.stopped=False
+
+        self.worker=threading.Thread(target=self.run, name=name, daemon=True)
+        self.worker.start()
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Future of function(*args, cancelEvent=..., **kwargs), run once the requests before it are done
+        or cancelled. Supersedes the request waiting to run and cancels the one running.
+        """
+        future=Future()
+
+        with self.condition:
+            if self.stopped:
+                raise RuntimeError("the planning service is shut down")
+
+            if self.pending is not None:
+                self.pending[0].cancel()
+
+            if self.running is not None:
+                self.running[1].set()
+
+            self.pending=(future, function, args, kwargs)
+            self.condition.notify()
+
+        return future
+
+    def cancel(self):
+        """
+        Cancels the request waiting to run and the one running, if any.
+        """
+        with self.condition:
+            if self.pending is not None:
+                self.pending[0].cancel()
+                self.pending=None
+            if self.running is not None:
+                self.running[1].set()
+
+    def run(self):
+
+        while True:
+            with self.condition:
+                while self.pending is None and not self.stopped:
+                    self.condition.wait()
+
+                if self.stopped:
+                    return
+
+                future, function, args, kwargs=self.pending
+                self.pending=None
+
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                cancel=threading.Event()
+                self.running=(future, cancel)
+
+            try:
+                result=function(*args, cancelEvent=cancel, **kwargs)
+            # the planners exit on failure, that must not stop the service
+            except BaseException as error:
+                future.set_exception(error)
+            else:
+                if cancel.is_set():
+                    future.set_exception(CancelledError())
+                else:
+                    future.set_result(result)
+            finally:
+                with self.condition:
+                    self.running=None
+
+    def shutdown(self, wait=True):
+        self.cancel()
+        with self.condition:
+            self.stopped=True
+            self.condition.notify()
+        if wait:
+            self.worker.join()
+
+
+if __name__=="__main__":
+
+    import time
+
+    # a burst of requests: only the first (cancelled while running) and the last one are searched
+    def slow_plan(goal, cancelEvent):
+        for _ in range(100):
+            if cancelEvent.is_set():
+                return None
+            time.sleep(0.01)
+        return goal
+
+    service=planningService()
+    futures=[service.submit(slow_plan, goal) for goal in range(10)]
+
+    for goal, future in enumerate(futures):
+        try:
+            print(goal, future.result())
+        except CancelledError:
+            print(goal, "cancelled", file=sys.stderr)
+
+    service.shutdown()
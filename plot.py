@@ -1,4 +1,3 @@
-import matplotlib.pyplot as plt
 from utilities import FileReader
 from typing import Dict, Any, List
 import os
@@ -29,6 +28,7 @@ obstacle_list = [
         ]
 
 def plot_errors(filename):
+    import matplotlib.pyplot as plt
     
     headers, values=FileReader(filename).read_file()
     
@@ -60,6 +60,7 @@ def plot_errors(filename):
     
     
 def plot_trajectory_information(information: Dict[str, Any], path: str=None):
+    import matplotlib.pyplot as plt
 
     _, values=FileReader(information["file"]).read_file()
 
@@ -0,0 +1,143 @@
+'''
+Low overhead latency recording for the hot paths (decision loop, planner, EKF).
+
+latencyHistogram is an HDR-style histogram: values are bucketed by powers of two,
+and each power of two is split into SUB_BUCKETS linear sub-buckets, so every
+recorded value keeps about 1.5% relative precision over the whole range (1 us to
+hours) with a fixed array of counters. Recording is an index computation and an
+increment, nothing is allocated on the hot path.
+
+latencyRecorder keeps one histogram per stage:
+
+    with LATENCIES.time("control"):
+        velocity, yaw_rate = controller.vel_request(...)
+
+and snapshot() gives the count/min/mean/percentiles of every stage as a dict that
+can be published or dumped as JSON.
+'''
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+SUB_BUCKET_BITS = 7
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HALF_SUB_BUCKETS = SUB_BUCKETS >> 1
+
+
+class latencyHistogram:
+
+    def __init__(self, unit_ns=1000, max_shift=40):
+        # values are recorded in multiples of unit_ns, 1 us by default
+        self.unit_ns = unit_ns
+        # a plain list, incrementing a python int is cheaper than a numpy scalar on every record
+        self.counts = [0] * (SUB_BUCKETS + max_shift * HALF_SUB_BUCKETS)
+        self.reset()
+
+    def reset(self):
+        self.counts[:] = [0] * len(self.counts)
+        self.total_count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+
+    def _index(self, units):
+        if units < SUB_BUCKETS:
+            return units
+        shift = units.bit_length() - SUB_BUCKET_BITS
+        return SUB_BUCKETS + (shift - 1) * HALF_SUB_BUCKETS + ((units >> shift) - HALF_SUB_BUCKETS)
+
+    def _value(self, index):
+        # lowest value (in ns) that lands in the bucket
+        if index < SUB_BUCKETS:
+            return index * self.unit_ns
+        shift = (index - SUB_BUCKETS) // HALF_SUB_BUCKETS + 1
+        sub = (index - SUB_BUCKETS) % HALF_SUB_BUCKETS + HALF_SUB_BUCKETS
+        return (sub << shift) * self.unit_ns
+
+    def record(self, value_ns):
+        value_ns = int(value_ns)
+        index = min(self._index(value_ns // self.unit_ns), len(self.counts) - 1)
+        self.counts[index] += 1
+
+        self.total_count += 1
+        self.total_ns += value_ns
+        self.max_ns = max(self.max_ns, value_ns)
+        self.min_ns = value_ns if self.min_ns is None else min(self.min_ns, value_ns)
+
+    def percentile(self, p):
+        if self.total_count == 0:
+            return 0
+        rank = max(1, int(np.ceil(p / 100.0 * self.total_count)))
+        index = int(np.searchsorted(np.cumsum(np.array(self.counts)), rank))
+        return min(self._value(index), self.max_ns)
+
+    def snapshot(self):
+        """
+        Summary of the recorded values, in milliseconds.
+        """
+        if self.total_count == 0:
+            return {"count": 0}
+
+        return {
+            "count": self.total_count,
+            "min_ms": self.min_ns / 1e6,
+            "mean_ms": self.total_ns / self.total_count / 1e6,
+            "p50_ms": self.percentile(50) / 1e6,
+            "p90_ms": self.percentile(90) / 1e6,
+            "p99_ms": self.percentile(99) / 1e6,
+            "p999_ms": self.percentile(99.9) / 1e6,
+            "max_ms": self.max_ns / 1e6,
+        }
+
+
+class latencyRecorder:
+
+    def __init__(self):
+        self.histograms = {}
+        # the stages are recorded from the control timer, the planning thread, the scan and
+        # localization callbacks at once
+        self.lock = threading.Lock()
+
+    def histogram(self, stage):
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = latencyHistogram()
+            return self.histograms[stage]
+
+    def record(self, stage, value_ns):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = latencyHistogram()
+            histogram.record(value_ns)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter_ns() - start)
+
+    def snapshot(self):
+        return {stage: histogram.snapshot() for stage, histogram in list(self.histograms.items())}
+
+    def to_json(self):
+        return json.dumps(self.snapshot())
+
+    def dump(self, filename):
+        with open(filename, 'w') as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+    def reset(self):
+        with self.lock:
+            for histogram in list(self.histograms.values()):
+                histogram.reset()
+
+
+# shared by all the modules of a process
+LATENCIES = latencyRecorder()
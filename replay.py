@@ -0,0 +1,223 @@
+'''
+Offline replay of the estimation and control stack, without rclpy.
+
+The nodes (localization, decision_maker) are driven by rclpy timers and subscriptions,
+so they only run in real time. replayEngine runs the same pieces on a stream of
+(stamp_ns, kind, data) events, as fast as the CPU allows:
+
+    - ODOM/IMU pairs are matched like the ApproximateTimeSynchronizer of localization
+      and fused by sensor_fusion.fusionPipeline (dt from the stamps)
+    - every control_period of stamp time the fused pose is given to the controller,
+      until the end of the path is within reachThreshold, like decision_maker
+    - every SCAN is scored against the likelihood field of the map at the fused pose
+
+The outputs are written with utilities.Logger like the nodes do: robotPose.csv with
+the localization headers, linear.csv/angular.csv from the PID controllers, plus
+commands.csv and scanScores.csv.
+
+Streams come from a rosbag2 bag (bag_stream) or are generated (synthetic_stream):
+
+    python replay.py --synthetic 60 --map room.yaml --path data/obstacle2_goal2.npy
+    python replay.py --bag my_bag --map room.yaml
+'''
+
+import time
+
+import numpy as np
+
+from sensor_fusion import fusionPipeline, odomImuSynchronizer, read_bag, FUSION_HEADERS
+from utilities import Logger, convertScanToCartesian, calculate_linear_error, euler_from_quaternion, stamp_to_ns
+from profiling import LATENCIES
+
+ODOM=0; IMU=1; SCAN=2
+
+COMMAND_HEADERS=["v", "w", "stamp"]
+SCORE_HEADERS=["score", "x", "y", "theta", "stamp"]
+
+
+class scanSample:
+    """
+    The fields of a sensor_msgs/LaserScan used by convertScanToCartesian.
+    """
+
+    def __init__(self, ranges, angle_min, angle_increment, range_min, range_max):
+        self.ranges=ranges
+        self.angle_min=angle_min
+        self.angle_increment=angle_increment
+        self.range_min=range_min
+        self.range_max=range_max
+
+
+class replayEngine:
+
+    def __init__(self, grid_map=None, controller=None, path=None, control_period=0.1, slop=0.1, reachThreshold=0.1,
+                 pose_log="robotPose.csv", command_log="commands.csv", score_log="scanScores.csv"):
+        """
+        grid_map: gridMap with a likelihood field, the scans are not scored without it
+        controller, path: anything with vel_request(pose, path, status), e.g. trajectoryController
+        ODOM data is [x, y, theta, v, w], IMU data is [ax, ay], SCAN data is a LaserScan or scanSample
+        """
+        self.fusion=fusionPipeline(reorder_window_ns=0, logger=Logger(pose_log, FUSION_HEADERS))
+        self.synchronizer=odomImuSynchronizer(slop)
+
+        self.grid_map=grid_map
+        self.controller=controller
+        self.path=path
+        self.control_period_ns=int(control_period * 1e9)
+        self.reachThreshold=reachThreshold
+
+        self.next_control=None
+        self.reached_goal=False
+        self.commands=[]
+        self.scores=[]
+
+        self.command_logger=Logger(command_log, COMMAND_HEADERS) if controller is not None else None
+        self.score_logger=Logger(score_log, SCORE_HEADERS) if grid_map is not None else None
+
+    def step(self, stamp, kind, data):
+
+        if kind == IMU:
+            self.synchronizer.add_imu(stamp, data)
+
+        elif kind == ODOM:
+            matched=self.synchronizer.match(stamp)
+            if matched is None:
+                return
+
+            imu_stamp, imu=matched
+            stamp=max(stamp, imu_stamp)
+
+            if self.fusion.kf is None:
+                self.fusion.initialize(data[0], data[1], data[2], stamp)
+
+            self.fusion.add_measurement(stamp, np.array([data[3], data[4], imu[0], imu[1]]))
+            self.control(stamp)
+
+        elif kind == SCAN and self.grid_map is not None and self.fusion.kf is not None:
+            self.score(stamp, data)
+
+    def control(self, stamp):
+
+        if self.controller is None or self.path is None or self.reached_goal:
+            return
+
+        if self.next_control is not None and stamp < self.next_control:
+            return
+        self.next_control=stamp + self.control_period_ns
+
+        pose=self.fusion.getPose()
+
+        if calculate_linear_error(pose, self.path[-1]) < self.reachThreshold:
+            self.reached_goal=True
+            self.controller.save_logs()
+            return
+
+        with LATENCIES.time("control"):
+            velocity, yaw_rate=self.controller.vel_request(pose, self.path, True)
+
+        self.commands.append([velocity, yaw_rate, stamp])
+        self.command_logger.log_values([velocity, yaw_rate, stamp])
+
+    def score(self, stamp, scan):
+
+        pose=self.fusion.getPose()
+        points, _=convertScanToCartesian(scan)
+
+        score=self.grid_map.scan_score(pose, points)
+
+        self.scores.append(score)
+        self.score_logger.log_values([score, pose[0], pose[1], pose[2], stamp])
+
+    def run(self, events):
+        for stamp, kind, data in events:
+            self.step(stamp, kind, data)
+        self.fusion.flush()
+        return self
+
+
+def synthetic_stream(duration=30.0, v=0.2, w=0.1, pose=(0.0, 0.0, 0.0), odom_rate=50.0, scan_rate=5.0,
+                     odom_std=(0.01, 0.02), imu_std=0.05, imu_delay=0.002, grid_map=None, beams=360,
+                     range_max=3.5, rng=None):
+    """
+    Events of a robot driving at constant v, w: odom with noisy twist, imu with the noisy
+    tangential (0) and centripetal (v*w) accelerations, and scans ray cast on grid_map.
+    """
+    rng=np.random.default_rng() if rng is None else rng
+
+    dt=1.0 / odom_rate
+    scan_every=max(int(round(odom_rate / scan_rate)), 1)
+    angles=np.linspace(-np.pi, np.pi, beams, endpoint=False)
+
+    x, y, theta=pose
+
+    for k in range(int(duration * odom_rate)):
+        stamp=int(k * dt * 1e9)
+
+        yield stamp + int(imu_delay * 1e9), IMU, np.array([0.0, v * w]) + rng.normal(0.0, imu_std, 2)
+        yield stamp, ODOM, np.array([x, y, theta,
+                                     v + rng.normal(0.0, odom_std[0]),
+                                     w + rng.normal(0.0, odom_std[1])])
+
+        if grid_map is not None and k % scan_every == 0:
+            ranges=grid_map.raycast([x, y, theta], angles, range_max)
+            yield stamp, SCAN, scanSample(ranges, angles[0], angles[1] - angles[0], 0.1, range_max)
+
+        x+=v * np.cos(theta) * dt
+        y+=v * np.sin(theta) * dt
+        theta+=w * dt
+
+
+def bag_stream(bag_path, odom_topic="/odom", imu_topic="/imu", scan_topic="/scan"):
+    """
+    Events of the odom/imu/scan messages of a rosbag2 bag.
+    """
+    for topic, msg, _ in read_bag(bag_path, [odom_topic, imu_topic, scan_topic]):
+        stamp=stamp_to_ns(msg.header.stamp)
+
+        if topic == odom_topic:
+            yield stamp, ODOM, np.array([msg.pose.pose.position.x,
+                                         msg.pose.pose.position.y,
+                                         euler_from_quaternion(msg.pose.pose.orientation),
+                                         msg.twist.twist.linear.x,
+                                         msg.twist.twist.angular.z])
+        elif topic == imu_topic:
+            yield stamp, IMU, np.array([msg.linear_acceleration.x, msg.linear_acceleration.y])
+        else:
+            yield stamp, SCAN, msg
+
+
+if __name__=="__main__":
+
+    import argparse
+
+    parser=argparse.ArgumentParser(description="Replay localization and control offline")
+    parser.add_argument("--bag", type=str, default=None)
+    parser.add_argument("--synthetic", type=float, default=30.0, help="duration of the synthetic stream when no bag is given")
+    parser.add_argument("--map", type=str, default=None, help="map yaml, enables the scan scoring")
+    parser.add_argument("--path", type=str, default=None, help=".npy path for the trajectory controller")
+    parser.add_argument("--seed", type=int, default=0)
+    args=parser.parse_args()
+
+    grid_map=None
+    if args.map is not None:
+        from gridMap import gridMap
+        grid_map=gridMap(args.map, laser_sig=0.1)
+        grid_map.make_likelihood_field()
+
+    controller, path=None, None
+    if args.path is not None:
+        from controller import trajectoryController
+        controller=trajectoryController(klp=0.2, klv=0.5, kap=0.8, kav=0.6)
+        path=np.load(args.path).tolist()
+
+    if args.bag is not None:
+        events=bag_stream(args.bag)
+    else:
+        events=synthetic_stream(args.synthetic, grid_map=grid_map, rng=np.random.default_rng(args.seed))
+
+    start=time.perf_counter()
+    engine=replayEngine(grid_map, controller, path).run(events)
+    elapsed=time.perf_counter() - start
+
+    print(f"replayed in {elapsed:.2f} s, {len(engine.commands)} commands, {len(engine.scores)} scans scored")
+    print(LATENCIES.to_json())
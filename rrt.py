@@ -1,13 +1,14 @@
 
 import math
-import random
 
-import matplotlib.pyplot as plt
 import numpy as np
 from typing import List
 
 show_animation = True
 
+# number of random samples drawn from the generator at once
+SAMPLE_BATCH_SIZE = 1024
+
 
 class RRT:
     """
@@ -46,6 +47,7 @@ class RRT:
                  max_iter=500,
                  play_area=None,
                  robot_radius=0.0,
+                 rng=None,
                  ):
         """
         Setting Parameter
@@ -56,6 +58,7 @@ class RRT:
         randArea:Random Sampling Area [min,max]
         play_area:stay inside this area [xmin,xmax,ymin,ymax]
         robot_radius: robot body modeled as circle with given radius
+        rng: numpy.random.Generator used for sampling, a fresh unseeded one if None
 
         """
         self.start = self.Node(start[0], start[1])
@@ -73,6 +76,12 @@ class RRT:
         self.obstacle_list = obstacle_list
         self.node_list = []
         self.robot_radius = robot_radius
+        # optional threading/multiprocessing Event, planning gives up once it is set
+        self.cancel_event = None
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.goal_draws = np.empty(0)
+        self.rand_samples = np.empty((0, 2))
+        self.sample_index = 0
 
     def planning(self, animation=True):
         """
@@ -83,6 +92,9 @@ class RRT:
 
         self.node_list = [self.start]
         for i in range(self.max_iter):
+            if self.is_cancelled():
+                return None
+
             rnd_node = self.get_random_node()
             nearest_ind = self.get_nearest_node_index(self.node_list, rnd_node)
             nearest_node = self.node_list[nearest_ind]
@@ -194,21 +206,36 @@ class RRT:
         smooth_points.append(path[-1])
         return smooth_points
 
+    def is_cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
     def calc_dist_to_goal(self, x, y):
         dx = x - self.end.x
         dy = y - self.end.y
         return math.hypot(dx, dy)
 
+    def draw_samples(self):
+        # one generator call per batch instead of three per node
+        self.goal_draws = self.rng.integers(0, 101, size=SAMPLE_BATCH_SIZE)
+        self.rand_samples = self.rng.uniform(self.min_rand, self.max_rand, size=(SAMPLE_BATCH_SIZE, 2))
+        self.sample_index = 0
+
     def get_random_node(self):
-        if random.randint(0, 100) > self.goal_sample_rate:
-            rnd = self.Node(
-                random.uniform(self.min_rand, self.max_rand),
-                random.uniform(self.min_rand, self.max_rand))
+        if self.sample_index >= len(self.goal_draws):
+            self.draw_samples()
+
+        i = self.sample_index
+        self.sample_index += 1
+
+        if self.goal_draws[i] > self.goal_sample_rate:
+            rnd = self.Node(float(self.rand_samples[i, 0]), float(self.rand_samples[i, 1]))
         else:  # goal point sampling
             rnd = self.Node(self.end.x, self.end.y)
         return rnd
 
     def draw_graph(self, rnd=None):
+        import matplotlib.pyplot as plt
+
         plt.clf()
         # for stopping simulation with the esc key.
         plt.gcf().canvas.mpl_connect(
@@ -243,6 +270,8 @@ class RRT:
 
     @staticmethod
     def plot_circle(x, y, size, color="-b"):  # pragma: no cover
+        import matplotlib.pyplot as plt
+
         deg = list(range(0, 360, 5))
         deg.append(0)
         xl = [x + size * math.cos(np.deg2rad(d)) for d in deg]
@@ -329,6 +358,8 @@ def main(gx=6.0, gy=10.0):
 
         # Draw final path
         if show_animation:
+            import matplotlib.pyplot as plt
+
             rrt.draw_graph()
             plt.plot([x for (x, y) in path], [y for (x, y) in path], '-r')
             plt.grid(True)
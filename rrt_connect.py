@@ -0,0 +1,191 @@
+'''
+This code implements the RRT-Connect algorithm, a bidirectional variant of RRT.
+
+Instead of growing a single tree from the start and hoping to hit the goal, two
+trees are grown: one rooted at the start and one rooted at the goal. On every
+iteration one tree is extended one step towards a random sample (EXTEND), and the
+other tree is then greedily grown towards the new node until it either reaches it
+or gets blocked by an obstacle (CONNECT). The roles of the two trees are swapped
+after every iteration. Narrow passages are crossed much faster because the goal
+tree comes out to meet the start tree.
+
+The steer, collision and play area primitives are the ones from the RRT class.
+'''
+
+
+from rrt import RRT
+
+show_animation = True
+
+TRAPPED=0; ADVANCED=1; REACHED=2
+
+
+class RRTConnect(RRT):
+    """
+    Class for RRT-Connect planning
+    """
+
+    def __init__(self,
+                 start,
+                 goal,
+                 obstacle_list,
+                 rand_area,
+                 expand_dis=3.0,
+                 path_resolution=0.5,
+                 max_iter=500,
+                 play_area=None,
+                 robot_radius=0.0,
+                 rng=None,
+                 ):
+        """
+        Setting Parameter
+
+        start:Start Position [x,y]
+        goal:Goal Position [x,y]
+        obstacleList:obstacle Positions [[x,y,size],...]
+        randArea:Random Sampling Area [min,max]
+        play_area:stay inside this area [xmin,xmax,ymin,ymax]
+        robot_radius: robot body modeled as circle with given radius
+        rng: numpy.random.Generator used for sampling
+
+        """
+        # goal biasing is not needed, the goal tree is already pulling towards the start
+        super().__init__(start, goal, obstacle_list, rand_area, expand_dis,
+                         path_resolution, goal_sample_rate=-1, max_iter=max_iter,
+                         play_area=play_area, robot_radius=robot_radius, rng=rng)
+        self.start_tree = []
+        self.goal_tree = []
+
+    def planning(self, animation=True):
+        """
+        rrt connect path planning
+
+        animation: flag for animation on or off
+
+        The path is returned from the goal to the start, same as RRT and RRTStar.
+        """
+
+        self.start_tree = [self.start]
+        self.goal_tree = [self.end]
+
+        tree_a, tree_b = self.start_tree, self.goal_tree
+
+        for i in range(self.max_iter):
+            if self.is_cancelled():
+                return None
+
+            rnd_node = self.get_random_node()
+
+            status, new_node = self.extend(tree_a, rnd_node)
+
+            if status != TRAPPED:
+                status, connect_node = self.connect(tree_b, new_node)
+
+                if status == REACHED:
+                    if tree_a is self.start_tree:
+                        return self.generate_connected_course(new_node, connect_node)
+                    return self.generate_connected_course(connect_node, new_node)
+
+            if animation and i % 5 == 0:
+                self.node_list = self.start_tree + self.goal_tree
+                self.draw_graph(rnd_node)
+
+            # grow the other tree on the next iteration
+            tree_a, tree_b = tree_b, tree_a
+
+        return None  # cannot find path
+
+    def extend(self, tree, to_node):
+        """
+        Takes a single step of at most expand_dis from the nearest node in tree towards to_node.
+        Returns the status (TRAPPED, ADVANCED or REACHED) and the new node, if any.
+        """
+        nearest_ind = self.get_nearest_node_index(tree, to_node)
+        nearest_node = tree[nearest_ind]
+
+        new_node = self.steer(nearest_node, to_node, self.expand_dis)
+
+        if not (self.check_if_outside_play_area(new_node, self.play_area) and
+                self.check_collision(new_node, self.obstacle_list, self.robot_radius)):
+            return TRAPPED, None
+
+        tree.append(new_node)
+
+        if new_node.x == to_node.x and new_node.y == to_node.y:
+            return REACHED, new_node
+
+        return ADVANCED, new_node
+
+    def connect(self, tree, to_node):
+        """
+        Keeps extending tree towards to_node until it is reached or the tree gets trapped.
+        Returns the status of the last extension and the last node added to the tree.
+        """
+        status, last_node = ADVANCED, None
+
+        while status == ADVANCED:
+            status, new_node = self.extend(tree, to_node)
+            if new_node is not None:
+                last_node = new_node
+
+        return status, last_node
+
+    def generate_connected_course(self, start_tree_node, goal_tree_node):
+        """
+        Joins the branch of the start tree ending at start_tree_node with the
+        branch of the goal tree ending at goal_tree_node (both nodes are at the
+        same position). The path goes from the goal to the start.
+        """
+        path = []
+
+        node = goal_tree_node
+        while node is not None:
+            path.append([node.x, node.y])
+            node = node.parent
+
+        # the meeting point is already in the path
+        path = path[::-1]
+
+        node = start_tree_node.parent
+        while node is not None:
+            path.append([node.x, node.y])
+            node = node.parent
+
+        return path
+
+
+def main(gx=6.0, gy=10.0):
+    print("start " + __file__)
+
+    # ====Search Path with RRT-Connect====
+    obstacleList = [(5, 5, 1), (3, 6, 2), (3, 8, 2), (3, 10, 2), (7, 5, 2),
+                    (9, 5, 2), (8, 10, 1)]  # [x, y, radius]
+    # Set Initial parameters
+    rrt_connect = RRTConnect(
+        start=[0, 0],
+        goal=[gx, gy],
+        rand_area=[-2, 15],
+        obstacle_list=obstacleList,
+        robot_radius=0.8
+        )
+    path = rrt_connect.planning(animation=show_animation)
+
+    if path is None:
+        print("Cannot find path")
+    else:
+        print("found path!!")
+
+        # Draw final path
+        if show_animation:
+            import matplotlib.pyplot as plt
+
+            rrt_connect.node_list = rrt_connect.start_tree + rrt_connect.goal_tree
+            rrt_connect.draw_graph()
+            plt.plot([x for (x, y) in path], [y for (x, y) in path], '-r')
+            plt.grid(True)
+            plt.pause(0.01)  # Need for Mac
+            plt.show()
+
+
+if __name__ == '__main__':
+    main()
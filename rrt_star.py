@@ -41,7 +41,6 @@ in complex environments. The visualization part (if show_animation is True) illu
 
 import math
 import sys
-import matplotlib.pyplot as plt
 import pathlib
 
 from rrt import RRT
@@ -70,7 +69,9 @@ class RRTStar(RRT):
                  max_iter=300,
                  connect_circle_dist=50.0,
                  search_until_max_iter=False,
-                 robot_radius=0.0):
+                 robot_radius=0.0,
+                 rng=None,
+                 smooth_output=True):
         """
         Setting Parameter
 
@@ -78,14 +79,18 @@ class RRTStar(RRT):
         goal:Goal Position [x,y]
         obstacleList:obstacle Positions [[x,y,size],...]
         randArea:Random Sampling Area [min,max]
+        rng: numpy.random.Generator used for sampling
+        smooth_output: apply smooth_trajectory to the returned path, turn off when the path
+                       goes through path_processing afterwards
 
         """
         super().__init__(start, goal, obstacle_list, rand_area, expand_dis,
                          path_resolution, goal_sample_rate, max_iter,
-                         robot_radius=robot_radius)
+                         robot_radius=robot_radius, rng=rng)
         self.connect_circle_dist = connect_circle_dist
         self.goal_node = self.Node(goal[0], goal[1])
         self.search_until_max_iter = search_until_max_iter
+        self.smooth_output = smooth_output
         self.node_list = []
 
     """
@@ -107,6 +112,9 @@ class RRTStar(RRT):
 
         self.node_list = [self.start]
         for i in range(self.max_iter):
+            if self.is_cancelled():
+                return None
+
             # Progress printout
             print("Iter:", i, ", number of nodes:", len(self.node_list)) 
 
@@ -133,16 +141,18 @@ class RRTStar(RRT):
                 last_index = self.search_best_goal_node()
                 if last_index is not None:
                     path = self.generate_final_course(last_index)
-                    smooth_path = self.smooth_trajectory(path=path, window_size=5)
-                    return smooth_path
+                    if self.smooth_output:
+                        path = self.smooth_trajectory(path=path, window_size=5)
+                    return path
 
         print("reached max iteration")
 
         last_index = self.search_best_goal_node()
         if last_index is not None:
             path = self.generate_final_course(last_index)
-            smooth_path = self.smooth_trajectory(path=path, window_size=5)
-            return smooth_path
+            if self.smooth_output:
+                path = self.smooth_trajectory(path=path, window_size=5)
+            return path
 
         return None
 
@@ -348,6 +358,8 @@ def main():
 
         # Draw final path
         if show_animation:
+            import matplotlib.pyplot as plt
+
             rrt_star.draw_graph()
             plt.plot([x for (x, y) in path], [y for (x, y) in path], 'r--', linewidth = '2.0')
             plt.grid(True)
@@ -0,0 +1,224 @@
+'''
+Odometry/IMU fusion pipeline of the localization, independent of the ROS node.
+
+dt for the EKF is taken from the header stamps of the synchronized odom/imu pairs,
+not from the wall clock, so the estimate does not depend on callback latency or CPU
+load and a bag gives the same result whatever speed it is replayed at.
+
+Measurements go through a short reorder buffer: a measurement is only fused once
+measurements newer than it by reorder_window_ns have been seen, so pairs coming out of
+the synchronizer slightly out of order are still fused in stamp order. Measurements
+older than the last fused one are dropped (and counted in self.dropped).
+
+replay_bag runs the same pipeline over a recorded rosbag2 bag, as fast as possible or
+at a given multiple of real time:
+
+    python sensor_fusion.py my_bag --speed 50 --log results/robotPose_replay.csv
+'''
+
+import heapq
+import time
+
+import numpy as np
+
+from kalman_filter import fast_kalman_filter
+from profiling import LATENCIES
+from utilities import Logger, normalize_angle, euler_from_quaternion, stamp_to_ns
+
+FUSION_HEADERS=["imu_ax", "imu_ay", "kf_ax", "kf_ay","kf_vx","kf_w","kf_x", "kf_y","stamp"]
+
+
+class fusionPipeline:
+
+    def __init__(self, Q=None, R=None, P=None, reorder_window_ns=30000000, max_dt=0.5, logger=None):
+        """
+        Q, R, P: EKF covariances, the ones of the localization node by default
+        reorder_window_ns: how long a measurement waits in the buffer for older ones
+        max_dt: dt is clamped to this, e.g. after a gap in the data
+        logger: utilities.Logger with FUSION_HEADERS, one row per fused measurement
+        """
+        self.Q=0.3*np.eye(6) if Q is None else Q
+        self.R=0.1*np.eye(4) if R is None else R
+        self.P=1*np.eye(6) if P is None else P
+
+        self.reorder_window_ns=reorder_window_ns
+        self.max_dt=max_dt
+        self.logger=logger
+
+        self.kf=None
+        self.buffer=[]
+        self.sequence=0
+        self.newest_stamp=None
+        self.last_stamp=None
+        self.dropped=0
+
+    def initialize(self, x, y, theta, stamp_ns):
+        self.kf=fast_kalman_filter(self.P, self.Q, self.R, [x, y, theta, 0, 0, 0])
+        self.last_stamp=stamp_ns
+
+    def add_measurement(self, stamp_ns, z):
+        """
+        Buffers the measurement z=[v, w, ax, ay] and fuses the ones that are old enough.
+        Returns the number of measurements fused.
+        """
+        if self.last_stamp is not None and stamp_ns < self.last_stamp:
+            self.dropped+=1
+            return 0
+
+        # the sequence number keeps the heap from comparing the arrays of equal stamps
+        heapq.heappush(self.buffer, (stamp_ns, self.sequence, z))
+        self.sequence+=1
+
+        if self.newest_stamp is None or stamp_ns > self.newest_stamp:
+            self.newest_stamp=stamp_ns
+
+        fused=0
+        while self.buffer and self.buffer[0][0] <= self.newest_stamp - self.reorder_window_ns:
+            stamp, _, z=heapq.heappop(self.buffer)
+            self.fuse(stamp, z)
+            fused+=1
+
+        return fused
+
+    def flush(self):
+        while self.buffer:
+            stamp, _, z=heapq.heappop(self.buffer)
+            self.fuse(stamp, z)
+
+    def fuse(self, stamp_ns, z):
+
+        dt=min((stamp_ns - self.last_stamp) / 1e9, self.max_dt)
+        self.last_stamp=stamp_ns
+
+        with LATENCIES.time("ekf_predict"):
+            self.kf.predict(dt)
+        with LATENCIES.time("ekf_update"):
+            self.kf.update(z)
+
+        if self.logger is not None:
+            xhat=self.kf.get_states()
+            self.logger.log_values([z[2], z[3], xhat[5], xhat[4]*xhat[3], xhat[4], xhat[3], xhat[0], xhat[1], stamp_ns])
+
+    def getPose(self):
+        """
+        [x, y, theta, stamp_ns] of the last fused measurement.
+        """
+        xhat=self.kf.get_states()
+        return [xhat[0], xhat[1], normalize_angle(xhat[2]), self.last_stamp]
+
+
+def odom_imu_measurement(odom_msg, imu_msg):
+    return np.array([odom_msg.twist.twist.linear.x,
+                     odom_msg.twist.twist.angular.z,
+                     imu_msg.linear_acceleration.x,
+                     imu_msg.linear_acceleration.y])
+
+
+def read_bag(bag_path, topics, storage_id="sqlite3"):
+    """
+    Yields (topic, message, receive time ns) of the given topics of a rosbag2 bag.
+    """
+    import rosbag2_py
+    from rclpy.serialization import deserialize_message
+    from rosidl_runtime_py.utilities import get_message
+
+    reader=rosbag2_py.SequentialReader()
+    reader.open(rosbag2_py.StorageOptions(uri=bag_path, storage_id=storage_id),
+                rosbag2_py.ConverterOptions(input_serialization_format="cdr", output_serialization_format="cdr"))
+
+    types={topic.name: get_message(topic.type) for topic in reader.get_all_topics_and_types()}
+    reader.set_filter(rosbag2_py.StorageFilter(topics=topics))
+
+    while reader.has_next():
+        topic, data, receive_time=reader.read_next()
+        yield topic, deserialize_message(data, types[topic]), receive_time
+
+
+class odomImuSynchronizer:
+    """
+    Pairs each odom sample with the imu sample closest in stamp, within slop seconds,
+    like the ApproximateTimeSynchronizer of the node. Works on any (stamp_ns, item).
+    """
+
+    def __init__(self, slop=0.1, queue_size=10):
+        self.slop_ns=slop * 1e9
+        self.queue_size=queue_size
+        self.imu_queue=[]
+
+    def add_imu(self, stamp_ns, imu):
+        self.imu_queue.append((stamp_ns, imu))
+        if len(self.imu_queue) > self.queue_size:
+            self.imu_queue.pop(0)
+
+    def match(self, stamp_ns):
+        """
+        (imu stamp, imu) closest to stamp_ns, None if there is none within slop.
+        """
+        if not self.imu_queue:
+            return None
+
+        imu_stamp, imu=min(self.imu_queue, key=lambda sample: abs(sample[0] - stamp_ns))
+        if abs(imu_stamp - stamp_ns) > self.slop_ns:
+            return None
+
+        return imu_stamp, imu
+
+
+def replay_bag(bag_path, pipeline, odom_topic="/odom", imu_topic="/imu", slop=0.1, speed=None):
+    """
+    Fuses the odom/imu pairs of a bag, paired by odomImuSynchronizer.
+    speed=None replays as fast as possible, otherwise at speed times real time.
+    Returns the number of pairs given to the pipeline.
+    """
+    synchronizer=odomImuSynchronizer(slop)
+    pairs=0
+    start_wall=time.perf_counter()
+    start_bag=None
+
+    for topic, msg, receive_time in read_bag(bag_path, [odom_topic, imu_topic]):
+
+        if speed is not None:
+            start_bag=receive_time if start_bag is None else start_bag
+            wait=(receive_time - start_bag) / 1e9 / speed - (time.perf_counter() - start_wall)
+            if wait > 0:
+                time.sleep(wait)
+
+        if topic == imu_topic:
+            synchronizer.add_imu(stamp_to_ns(msg.header.stamp), msg)
+            continue
+
+        stamp=stamp_to_ns(msg.header.stamp)
+        matched=synchronizer.match(stamp)
+        if matched is None:
+            continue
+
+        imu_stamp, imu_msg=matched
+        stamp=max(stamp, imu_stamp)
+
+        if pipeline.kf is None:
+            pipeline.initialize(msg.pose.pose.position.x, msg.pose.pose.position.y,
+                                euler_from_quaternion(msg.pose.pose.orientation), stamp)
+
+        pipeline.add_measurement(stamp, odom_imu_measurement(msg, imu_msg))
+        pairs+=1
+
+    pipeline.flush()
+    return pairs
+
+if __name__=="__main__":
+
+    import argparse
+
+    parser=argparse.ArgumentParser(description="Replay the odom/imu fusion over a rosbag2 bag")
+    parser.add_argument("bag")
+    parser.add_argument("--speed", type=float, default=None, help="multiple of real time, as fast as possible if not given")
+    parser.add_argument("--log", default="robotPose_replay.csv")
+    parser.add_argument("--odom-topic", default="/odom")
+    parser.add_argument("--imu-topic", default="/imu")
+    args=parser.parse_args()
+
+    pipeline=fusionPipeline(logger=Logger(args.log, FUSION_HEADERS))
+
+    start=time.perf_counter()
+    pairs=replay_bag(args.bag, pipeline, args.odom_topic, args.imu_topic, speed=args.speed)
+    print(f"fused {pairs} odom/imu pairs in {time.perf_counter() - start:.2f} s, {pipeline.dropped} dropped out of order")
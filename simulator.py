@@ -0,0 +1,271 @@
+'''
+Kinematic unicycle simulator for closed-loop evaluation without Gazebo.
+
+unicycleSimulator integrates the commanded (v, w), clipped to the TurtleBot limits,
+and produces odom (pose integrated from the noisy twist, so it drifts like wheel
+odometry) and IMU (noisy tangential and centripetal accelerations) samples. The
+samples are fed to replay.replayEngine, i.e. to the same fusion pipeline and
+controller as decision_maker, and the commands of the controller are applied back to
+the simulator.
+
+run_episodes runs many episodes in parallel processes, e.g. a sweep of the PID gains
+over the data/obstacle<k>_goal<g>.npy paths:
+
+    python simulator.py --klp 0.2 0.4 --kap 0.6 0.8 1.0 --workers 8 --out sweep.json
+'''
+
+import itertools
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from replay import replayEngine, ODOM, IMU
+from path_processing import circleCollisionChecker
+
+PID_GAINS=dict(klp=0.2, klv=0.5, kap=0.8, kav=0.6)
+
+
+class unicycleSimulator:
+
+    def __init__(self, pose=(0.0, 0.0, 0.0), dt=0.02, v_max=0.22, w_max=2.84, odom_std=(0.01, 0.02),
+                 imu_std=0.05, imu_delay=0.002, rng=None):
+        """
+        dt: step of the integration, also the period of the odom/imu samples
+        odom_std: standard deviation of the measured v and w
+        imu_std: standard deviation of the measured accelerations
+        """
+        self.pose=np.array(pose, dtype=float)
+        self.odom_pose=self.pose.copy()
+        self.dt=dt
+        self.v_max=v_max
+        self.w_max=w_max
+        self.odom_std=np.asarray(odom_std, dtype=float)
+        self.imu_std=imu_std
+        self.imu_delay_ns=int(imu_delay * 1e9)
+        self.rng=np.random.default_rng() if rng is None else rng
+
+        self.v=0.0
+        self.w=0.0
+        self.steps=0
+
+    def stamp(self):
+        return int(round(self.steps * self.dt * 1e9))
+
+    def step(self, v, w):
+        """
+        Applies (v, w) for dt, returns the odom and imu events of the new state.
+        """
+        v=float(np.clip(v, -self.v_max, self.v_max))
+        w=float(np.clip(w, -self.w_max, self.w_max))
+
+        x, y, theta=self.pose
+        self.pose[:]=[x + v*np.cos(theta)*self.dt, y + v*np.sin(theta)*self.dt, theta + w*self.dt]
+
+        v_measured, w_measured=np.array([v, w]) + self.rng.normal(0.0, 1.0, 2) * self.odom_std
+        x, y, theta=self.odom_pose
+        self.odom_pose[:]=[x + v_measured*np.cos(theta)*self.dt, y + v_measured*np.sin(theta)*self.dt,
+                           theta + w_measured*self.dt]
+
+        acceleration=np.array([(v - self.v) / self.dt, v*w]) + self.rng.normal(0.0, self.imu_std, 2)
+
+        self.v, self.w=v, w
+        self.steps+=1
+
+        stamp=self.stamp()
+        return [(stamp + self.imu_delay_ns, IMU, acceleration),
+                (stamp, ODOM, np.array([*self.odom_pose, v_measured, w_measured]))]
+
+
+@contextmanager
+def _working_directory(path):
+    # the loggers of the controllers write to the current directory
+    previous=os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def distance_to_path(points, path):
+    """
+    Distance of each of the (N, 2) points to the polyline path.
+    """
+    points=np.asarray(points, dtype=float).reshape(-1, 2)
+    path=np.asarray(path, dtype=float)
+
+    starts=path[:-1]
+    segments=np.diff(path, axis=0)
+    lengths_sq=np.maximum(np.sum(segments**2, axis=1), 1e-12)
+
+    t=np.clip(np.sum((points[:, None, :] - starts[None, :, :]) * segments[None, :, :], axis=2) / lengths_sq, 0.0, 1.0)
+    projections=starts[None, :, :] + t[:, :, None] * segments[None, :, :]
+    return np.min(np.linalg.norm(points[:, None, :] - projections, axis=2), axis=1)
+
+
+def make_controller(controller_type, gains, checker):
+
+    if controller_type == "mpc":
+        from mpc import mpcController
+        costLookup=None if checker is None else (lambda points: 1.0 - checker.points_free(points))
+        return mpcController(costLookup=costLookup, **gains)
+
+    from controller import trajectoryController
+    return trajectoryController(**gains)
+
+
+def run_episode(path, gains=None, obstacle_list=None, robot_radius=0.2, controller_type="pid", seed=0,
+                max_time=300.0, dt=0.02, control_period=0.1, log_dir=None, name="episode"):
+    """
+    Drives the simulated robot along path with the controller of decision_maker until the
+    goal is reached, the robot collides with obstacle_list or max_time (simulated) runs out.
+    The csv logs are written in log_dir/name, or discarded if log_dir is None.
+    """
+    gains=dict(PID_GAINS if controller_type == "pid" else {}, **(gains or {}))
+    path=np.asarray(path, dtype=float).tolist()
+    checker=None if obstacle_list is None else circleCollisionChecker(obstacle_list, robot_radius)
+
+    rng=np.random.default_rng(seed)
+    simulator=unicycleSimulator(pose=(path[0][0], path[0][1], 0.0), dt=dt, rng=rng)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        directory=scratch if log_dir is None else os.path.join(log_dir, name)
+        os.makedirs(directory, exist_ok=True)
+
+        with _working_directory(directory):
+            engine=replayEngine(controller=make_controller(controller_type, gains, checker), path=path,
+                                control_period=control_period)
+
+            start=time.perf_counter()
+            velocity, yaw_rate=0.0, 0.0
+            truth, estimates=[], []
+            collided=False
+
+            for step in range(int(max_time / dt)):
+                for event in simulator.step(velocity, yaw_rate):
+                    engine.step(*event)
+
+                if engine.fusion.kf is not None:
+                    truth.append(simulator.pose.copy())
+                    estimates.append(engine.fusion.getPose()[:3])
+
+                if engine.commands:
+                    velocity, yaw_rate=engine.commands[-1][:2]
+
+                if engine.reached_goal:
+                    break
+
+                if checker is not None and not checker.points_free(simulator.pose[:2])[0]:
+                    collided=True
+                    break
+
+            wall_time=time.perf_counter() - start
+
+    result={
+        "name": name,
+        "gains": gains,
+        "seed": seed,
+        "reached": bool(engine.reached_goal),
+        "collided": collided,
+        "time": simulator.steps * dt,
+        "wall_time": wall_time,
+    }
+
+    # the fusion never started (e.g. max_time shorter than the first odom/imu pair), the episode failed
+    if not truth:
+        result.update(reached=False, final_error=float("nan"), tracking_error=float("nan"),
+                      localization_error=float("nan"))
+        return result
+
+    truth=np.array(truth)
+    estimates=np.array(estimates)
+
+    result.update({
+        "final_error": float(np.linalg.norm(truth[-1, :2] - np.array(path[-1]))),
+        "tracking_error": float(np.mean(distance_to_path(truth[:, :2], path))),
+        "localization_error": float(np.mean(np.linalg.norm(truth[:, :2] - estimates[:, :2], axis=1))),
+    })
+    return result
+
+
+def _run_episode(spec):
+    return run_episode(**spec)
+
+
+def run_episodes(specs, max_workers=None):
+    """
+    Runs the episodes (dicts of run_episode arguments) in parallel processes, the results are in the order of specs.
+    """
+    specs=list(specs)
+    if max_workers == 1 or len(specs) == 1:
+        return [_run_episode(spec) for spec in specs]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_run_episode, specs))
+
+
+def scenario_obstacles(filename):
+    """
+    The obstacle list data/obstacle<k>_goal<g>.npy was planned in.
+    """
+    from planner import OBSTACLE_LISTS
+
+    base=os.path.basename(filename)
+    if base.startswith("obstacle"):
+        return OBSTACLE_LISTS.get(int(base[len("obstacle"):].split("_")[0]))
+    return None
+
+
+if __name__=="__main__":
+
+    import argparse
+    import glob
+
+    parser=argparse.ArgumentParser(description="Closed-loop controller sweeps on the kinematic simulator")
+    parser.add_argument("--scenarios", nargs="+", default=sorted(glob.glob("data/obstacle*_goal*.npy")))
+    parser.add_argument("--controller", default="pid", choices=["pid", "mpc"])
+    parser.add_argument("--klp", type=float, nargs="+", default=[PID_GAINS["klp"]])
+    parser.add_argument("--klv", type=float, nargs="+", default=[PID_GAINS["klv"]])
+    parser.add_argument("--kap", type=float, nargs="+", default=[PID_GAINS["kap"]])
+    parser.add_argument("--kav", type=float, nargs="+", default=[PID_GAINS["kav"]])
+    parser.add_argument("--seeds", type=int, default=1, help="noise seeds per scenario and gains")
+    parser.add_argument("--max-time", type=float, default=300.0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--log-dir", default=None, help="keep the csv logs of every episode in this directory")
+    parser.add_argument("--out", default=None, help="json file for the results of all the episodes")
+    args=parser.parse_args()
+
+    grid=[{}] if args.controller == "mpc" else \
+        [dict(klp=klp, klv=klv, kap=kap, kav=kav) for klp, klv, kap, kav in itertools.product(args.klp, args.klv, args.kap, args.kav)]
+
+    specs=[]
+    for scenario, gains, seed in itertools.product(args.scenarios, grid, range(args.seeds)):
+        name=f"{os.path.splitext(os.path.basename(scenario))[0]}_{len(specs)}"
+        specs.append(dict(path=np.load(scenario), gains=gains, obstacle_list=scenario_obstacles(scenario),
+                          controller_type=args.controller, seed=seed, max_time=args.max_time,
+                          log_dir=args.log_dir, name=name))
+
+    start=time.perf_counter()
+    results=run_episodes(specs, args.workers)
+    print(f"{len(results)} episodes in {time.perf_counter() - start:.1f} s")
+
+    # success rate and mean time to goal of every gain set, over the scenarios and seeds
+    summary={}
+    for result in results:
+        key=json.dumps(result["gains"], sort_keys=True)
+        summary.setdefault(key, []).append(result)
+
+    for key, runs in sorted(summary.items(), key=lambda item: -np.mean([run["reached"] for run in item[1]])):
+        reached=[run for run in runs if run["reached"]]
+        mean_time=np.mean([run["time"] for run in reached]) if reached else float("nan")
+        print(f"{key}: reached {len(reached)}/{len(runs)}, collided {sum(run['collided'] for run in runs)}, "
+              f"time {mean_time:.1f} s, tracking error {np.nanmean([run['tracking_error'] for run in runs]):.3f} m")
+
+    if args.out is not None:
+        with open(args.out, "w") as file:
+            json.dump(results, file, indent=2)
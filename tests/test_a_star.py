@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from a_star import distanceFields
+
+
+def test_compute_rejects_only_the_obstacle_cells():
+    costMap = np.zeros((30, 30))
+    costMap[10, 10] = 1.0
+    fields = distanceFields(costMap)
+
+    with pytest.raises(ValueError, match=r"\(10, 10\)"):
+        fields.compute([(2, 2), (10, 10), (20, 20)])
+
+    # the fields of the other cells are cached anyway
+    assert fields.cached((2, 2)) and fields.cached((20, 20))
+    assert not fields.cached((10, 10))
+    assert fields.path((2, 2), (20, 20))[-1] == (20, 20)
+
+
+def test_start_on_an_obstacle_is_not_a_shortcut():
+    maze = np.zeros((20, 20))
+    maze[10, :] = 1.0
+    maze[10, 5] = 0.9
+    fields = distanceFields(maze.T)
+
+    # the start field leaves the wall cell, the other fields do not go through it
+    fields.compute([(10, 5), (2, 5)], starts=[(10, 5)])
+    assert np.isfinite(fields.field((10, 5))[0][2, 5])
+    assert not np.isfinite(fields.field((2, 5))[0][15, 5])
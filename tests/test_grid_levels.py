@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from a_star import max_pool
+from grid_levels import gridLevels
+
+
+def room(seed=0, shape=(60, 70)):
+    rng = np.random.default_rng(seed)
+    costMap = rng.random(shape) * 0.5
+    costMap[rng.random(shape) < 0.1] = 1.0
+    costMap[30, 5:] = 1.0
+    return costMap
+
+
+@pytest.mark.parametrize("factor", [1, 2, 3, 4, 7])
+def test_max_pool_is_conservative(factor):
+    costMap = room()
+    coarse = max_pool(costMap, factor)
+
+    assert coarse.shape == (-(-costMap.shape[0] // factor), -(-costMap.shape[1] // factor))
+
+    # every coarse cell costs at least as much as the cells it covers
+    rows, cols = np.indices(costMap.shape)
+    assert np.all(coarse[rows // factor, cols // factor] >= costMap)
+    # and exactly the worst of them
+    assert np.all(coarse == np.maximum.reduceat(np.maximum.reduceat(costMap, np.arange(0, costMap.shape[0], factor), axis=0),
+                                                np.arange(0, costMap.shape[1], factor), axis=1))
+
+
+def check_path(path, maze, start, end):
+    path = np.array(path)
+    assert tuple(path[0]) == start and tuple(path[-1]) == end
+    assert np.all(np.abs(np.diff(path, axis=0)).max(axis=1) == 1)
+    assert not np.any(maze[path[:, 0], path[:, 1]] > 0.8)
+
+
+@pytest.mark.parametrize("factor", [1, 2, 4])
+def test_search_paths_are_free(factor):
+    costMap = np.zeros((60, 70))
+    costMap[30, 5:] = 1.0
+    levels = gridLevels(costMap)
+
+    start, end = (10, 10), (60, 50)
+    check_path(levels.search(start, end, factor), costMap.T, start, end)
+
+
+def test_search_avoids_the_extra_obstacles():
+    costMap = np.zeros((60, 70))
+    costMap[30, 5:] = 1.0
+    levels = gridLevels(costMap)
+
+    # the gap of the wall is narrowed to two cells, the coarse level only has it as a guide
+    overlay = costMap.copy()
+    overlay[30, :3] = 1.0
+    start, end = (10, 10), (60, 50)
+
+    path = levels.search(start, end, 4, costMap=overlay)
+    check_path(path, overlay.T, start, end)
+
+
+def test_search_no_path():
+    costMap = np.zeros((40, 40))
+    costMap[20, :] = 1.0
+    assert gridLevels(costMap).search((5, 5), (35, 35), 4) is None
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from local_costmap import localCostmap
+
+
+def centre(cell, resolution):
+    return (cell + 0.5) * resolution
+
+
+def filled(seed=0):
+    layer = localCostmap(width=2.0, resolution=0.1)
+    layer.recenter(centre(0, 0.1), centre(0, 0.1))
+    layer.grid[:] = np.random.default_rng(seed).integers(0, 100, layer.grid.shape)
+    return layer
+
+
+@pytest.mark.parametrize("shift", [(3, 0), (-3, 0), (0, 5), (0, -5), (4, -7), (19, 1)])
+def test_shift_clears_the_leaving_cells(shift):
+    layer = filled()
+    before = layer.window().copy()
+    n = layer.size
+
+    layer.recenter(centre(shift[0], 0.1), centre(shift[1], 0.1))
+    after = layer.window()
+
+    # the cells in both windows keep their evidence, the entering ones are empty
+    expected = np.zeros_like(before)
+    rows = slice(max(shift[0], 0), n + min(shift[0], 0))
+    cols = slice(max(shift[1], 0), n + min(shift[1], 0))
+    expected[max(-shift[0], 0):n - max(shift[0], 0), max(-shift[1], 0):n - max(shift[1], 0)] = before[rows, cols]
+    assert np.array_equal(after, expected)
+
+
+def test_jump_clears_the_window():
+    layer = filled()
+    version = layer.version
+
+    layer.recenter(centre(100, 0.1), centre(-50, 0.1))
+    assert not layer.grid.any()
+    assert layer.version > version
+
+
+def test_going_back_does_not_bring_obstacles_back():
+    layer = localCostmap(width=2.0, resolution=0.1)
+    pose = [0.05, 0.05, 0.0]
+    for _ in range(3):
+        layer.update_points(pose, [[0.5, 0.0]])
+    assert layer.cost_at([[0.55, 0.05]])[0] == pytest.approx(1.0)
+
+    # the obstacle leaves the window and the robot comes back without seeing it again
+    layer.recenter(-1.5, 0.05)
+    layer.recenter(0.05, 0.05)
+    assert len(layer.obstacles()) == 0
+    assert layer.cost_at([[0.55, 0.05]])[0] < 0.5
+
+
+def test_beams_clear_and_mark():
+    layer = localCostmap(width=2.0, resolution=0.1)
+    pose = [0.05, 0.05, np.pi / 2]
+    for _ in range(3):
+        layer.update_points(pose, [[0.6, 0.0]])
+
+    # rotated by theta, the endpoint is 0.6 m ahead along y
+    assert np.allclose(layer.obstacles(), [[0.05, 0.65]])
+    assert layer.blocked([[0.05, 0.05], [0.05, 0.9]])
+    assert not layer.blocked([[0.5, 0.05], [0.5, 0.9]])
+
+    # the obstacle moved away, the beams through its cell clear it
+    version = layer.version
+    for _ in range(3):
+        layer.update_points(pose, [[0.9, 0.0]])
+    assert np.allclose(layer.obstacles(), [[0.05, 0.95]])
+    assert layer.version > version
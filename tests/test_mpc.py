@@ -0,0 +1,23 @@
+import numpy as np
+
+from mpc import mpcController
+
+
+def test_point_goal_keeps_the_warm_start():
+    controller = mpcController(horizon=10, samples=200, rng=np.random.default_rng(0))
+    pose = [0.0, 0.0, 0.0]
+
+    controller.vel_request(pose, [1.0, 0.5], True)
+    tracked = controller.tracker.source
+    warm_start = controller.nominal.copy()
+    assert np.any(warm_start[0] != 0.0)
+
+    # without noise the next command is the first one of the warm start, unless it was reset
+    controller.noise_std = np.zeros(2)
+    velocity, yaw_rate = controller.vel_request(pose, [1.0, 0.5], True)
+    assert controller.tracker.source is tracked
+    assert np.allclose([velocity, yaw_rate], warm_start[0])
+
+    # a new goal starts over
+    controller.vel_request(pose, [-1.0, 0.5], True)
+    assert controller.tracker.source is not tracked
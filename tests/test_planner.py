@@ -0,0 +1,33 @@
+import os
+
+import numpy as np
+import pytest
+
+import planner as planner_module
+from grid_levels import grid_levels_for
+from planner import planner, A_STAR_PLANNER
+
+
+@pytest.fixture(autouse=True)
+def repository(monkeypatch):
+    # the map is loaded from the working directory, and plan saves every path to data/obstacle2_goal2.npy
+    monkeypatch.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    monkeypatch.setattr(planner_module.np, "save", lambda *args, **kwargs: None)
+
+
+def test_a_star_on_a_coarse_level():
+    coarse = planner(A_STAR_PLANNER, postProcess=False, scaleFactor=4)
+    path = np.array(coarse.plan([0.5, 0.5], [2.5, 1.5]))
+
+    # the search went through the level max pooled by 4
+    assert 4 in grid_levels_for(coarse.costMap).levels
+
+    resolution = coarse.m_utilites.getResolution()
+    assert np.linalg.norm(path[0] - [0.5, 0.5]) < 2 * resolution
+    assert np.linalg.norm(path[-1] - [2.5, 1.5]) < 2 * resolution
+    assert np.all(np.linalg.norm(np.diff(path, axis=0), axis=1) < 2 * resolution)
+
+    # as long as the full resolution path, up to the detour along the coarse one
+    full = np.array(planner(A_STAR_PLANNER, postProcess=False).plan([0.5, 0.5], [2.5, 1.5]))
+    length = lambda path: np.sum(np.linalg.norm(np.diff(path, axis=0), axis=1))
+    assert length(full) - 1e-9 <= length(path) < 1.5 * length(full)
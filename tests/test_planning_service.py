@@ -0,0 +1,74 @@
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+from planning_service import planningService
+
+
+@pytest.fixture
+def service():
+    service = planningService()
+    yield service
+    service.shutdown()
+
+
+def blocking_plan(goal, started, release, cancelEvent):
+    started.set()
+    # returns as soon as it is cancelled, like the planners
+    while not release.wait(0.01):
+        if cancelEvent.is_set():
+            return None
+    return goal
+
+
+def test_latest_request_wins(service):
+    started, release = threading.Event(), threading.Event()
+
+    # ignores cancelEvent, so that the worker is busy until all the requests are submitted
+    def stubborn_plan(cancelEvent):
+        started.set()
+        release.wait(2.0)
+        return 0
+
+    first = service.submit(stubborn_plan)
+    assert started.wait(1.0)
+
+    # the ones in between are superseded before they start
+    middle = [service.submit(blocking_plan, goal, threading.Event(), release) for goal in range(1, 5)]
+    last = service.submit(blocking_plan, 5, threading.Event(), release)
+    release.set()
+
+    assert last.result(timeout=2.0) == 5
+    with pytest.raises(CancelledError):
+        first.result(timeout=2.0)
+    assert all(future.cancelled() for future in middle)
+
+
+def test_cancel_running_request(service):
+    started, release = threading.Event(), threading.Event()
+    future = service.submit(blocking_plan, 0, started, release)
+    assert started.wait(1.0)
+
+    service.cancel()
+    with pytest.raises(CancelledError):
+        future.result(timeout=2.0)
+
+
+def test_errors_go_to_the_future(service):
+
+    def failing_plan(cancelEvent):
+        raise SystemExit("no path")
+
+    with pytest.raises(SystemExit):
+        service.submit(failing_plan).result(timeout=2.0)
+
+    # the worker is still serving requests
+    assert service.submit(lambda cancelEvent: 1).result(timeout=2.0) == 1
+
+
+def test_submit_after_shutdown():
+    service = planningService()
+    service.shutdown()
+    with pytest.raises(RuntimeError):
+        service.submit(lambda cancelEvent: None)
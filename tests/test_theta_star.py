@@ -0,0 +1,84 @@
+import numpy as np
+
+from theta_star import thetaStar
+
+
+def walls(seed=0, shape=(40, 50), density=0.15):
+    rng = np.random.default_rng(seed)
+    costMap = np.zeros(shape)
+    costMap[rng.random(shape) < density] = 1.0
+    return costMap
+
+
+def sampled_cells(a, b, samples=4000):
+    """
+    Cells (maze rows, cols) of points sampled densely along the segment between the centres of a and b.
+    """
+    t = np.random.default_rng(1).random(samples)[:, None]
+    points = np.array(a) + t * (np.array(b) - np.array(a))
+    return np.floor(points + 0.5).astype(int)
+
+
+def test_line_of_sight_never_cuts_a_wall():
+    planner = thetaStar(walls())
+    rng = np.random.default_rng(2)
+
+    free = np.argwhere(~planner.blocked)
+    visible = 0
+    for _ in range(2000):
+        a, b = free[rng.integers(len(free), size=2)]
+        if planner.line_of_sight(a[0] * planner.cols + a[1], b[0] * planner.cols + b[1]):
+            visible += 1
+            cells = sampled_cells(a, b)
+            assert not planner.blocked[cells[:, 0], cells[:, 1]].any()
+
+    assert visible > 0
+
+
+def test_line_of_sight_with_base_sees_the_new_walls():
+    costMap = walls(density=0.05)
+    overlay = np.maximum(costMap, walls(seed=3, density=0.05))
+    planner = thetaStar(overlay, base=thetaStar(costMap))
+    rng = np.random.default_rng(4)
+
+    free = np.argwhere(~planner.blocked)
+    for _ in range(2000):
+        a, b = free[rng.integers(len(free), size=2)]
+        if planner.line_of_sight(a[0] * planner.cols + a[1], b[0] * planner.cols + b[1]):
+            cells = sampled_cells(a, b)
+            assert not planner.blocked[cells[:, 0], cells[:, 1]].any()
+
+
+def test_path_segments_are_free():
+    costMap = np.zeros((30, 30))
+    # a wall with a gap, the path has to bend through it
+    costMap[15, :25] = 1.0
+    planner = thetaStar(costMap)
+
+    path = planner.search((2, 2), (2, 28))
+    assert path[0] == (2, 2) and path[-1] == (2, 28)
+
+    for a, b in zip(path[:-1], path[1:]):
+        cells = sampled_cells(a, b)
+        assert not planner.blocked[cells[:, 0], cells[:, 1]].any()
+
+
+def test_no_path_through_a_closed_wall():
+    costMap = np.zeros((20, 20))
+    costMap[10, :] = 1.0
+    assert thetaStar(costMap).search((2, 2), (2, 18)) is None
+
+
+def test_start_next_to_a_wall():
+    maze = np.zeros((30, 30))
+    maze[10, :] = 1.0
+    # the start cell is in the inflated band of the wall, a_star.search plans from it as well
+    maze[11, 3:8] = 0.9
+    planner = thetaStar(maze.T)
+    assert planner.blocked[11, 5]
+
+    path = planner.search((11, 5), (25, 25))
+    assert path[0] == (11, 5) and path[-1] == (25, 25)
+    for a, b in zip(path[1:-1], path[2:]):
+        cells = sampled_cells(a, b)
+        assert not planner.blocked[cells[:, 0], cells[:, 1]].any()
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from tour_planner import solve_tour, tour_cost, nearest_neighbour_tour, plan_tour, concatenate_legs
+
+
+def random_distances(n, seed):
+    points = np.random.default_rng(seed).random((n, 2)) * 10
+    return np.linalg.norm(points[:, None] - points[None], axis=2)
+
+
+@pytest.mark.parametrize("closed", [False, True])
+@pytest.mark.parametrize("n", [1, 2, 3, 5, 9])
+def test_solve_tour_keeps_its_fixed_ends(n, closed):
+    for seed in range(5):
+        distances = random_distances(n, seed)
+        order = solve_tour(distances, closed)
+
+        assert order[0] == 0
+        if closed and n > 1:
+            assert order[-1] == 0
+            assert sorted(order[:-1]) == list(range(n))
+        else:
+            assert sorted(order) == list(range(n))
+
+
+@pytest.mark.parametrize("closed", [False, True])
+def test_solve_tour_improves_the_nearest_neighbour_tour(closed):
+    for seed in range(5):
+        distances = random_distances(12, seed)
+        order = solve_tour(distances, closed)
+        assert tour_cost(order, distances) <= tour_cost(nearest_neighbour_tour(distances, closed), distances) + 1e-9
+
+
+def test_plan_tour_legs_join_the_waypoints():
+    costMap = np.zeros((30, 30))
+    costMap[15, :25] = 1.0
+    waypoints = [(25, 25), (5, 25), (25, 5)]
+
+    visits, legs = plan_tour(costMap, (2, 2), waypoints)
+    assert sorted(visits) == [0, 1, 2]
+
+    path = concatenate_legs(legs)
+    assert tuple(path[0]) == (2, 2)
+    assert tuple(path[-1]) == waypoints[visits[-1]]
+    assert np.all(np.abs(np.diff(np.array(path), axis=0)).max(axis=1) == 1)
+    assert not np.any(costMap.T[tuple(np.array(path).T)] > 0.8)
+
+
+def test_plan_tour_unreachable_waypoint():
+    costMap = np.zeros((20, 20))
+    costMap[10, :] = 1.0
+    assert plan_tour(costMap, (2, 2), [(5, 5), (18, 18)]) == (None, None)
+
+
+@pytest.mark.parametrize("closed", [False, True])
+def test_plan_tour_from_a_start_next_to_a_wall(closed):
+    maze = np.zeros((30, 30))
+    maze[10, :25] = 1.0
+    # the start is in the inflated band of the wall, a_star.search plans from it as well
+    maze[11, 3:8] = 0.9
+    costMap = maze.T
+    waypoints = [(25, 25), (20, 5)]
+
+    visits, legs = plan_tour(costMap, (11, 5), waypoints, closed)
+    assert sorted(visits) == [0, 1]
+
+    path = np.array(concatenate_legs(legs))
+    assert tuple(path[0]) == (11, 5)
+    assert tuple(path[-1]) == ((11, 5) if closed else waypoints[visits[-1]])
+    assert np.all(np.abs(np.diff(path, axis=0)).max(axis=1) == 1)
+    # only the start (and the end of a closed tour) is on an obstacle
+    assert not np.any(maze[path[1:-1, 0], path[1:-1, 1]] > 0.8)
+
+
+def test_plan_tour_waypoint_in_the_inflated_band():
+    maze = np.zeros((30, 30))
+    maze[11, 3:8] = 0.9
+    assert plan_tour(maze.T, (2, 2), [(25, 25), (11, 5)]) == (None, None)
@@ -0,0 +1,213 @@
+'''
+Any-angle grid planning with Lazy Theta*.
+
+The search runs on the same grid as a_star.search (maze = costMap.T, cells with a cost
+above threshold are walls, 8-connected moves), but a node can take as parent any
+ancestor it has line of sight to, so the path is a few straight segments between
+corners instead of hundreds of 45 degree steps.
+
+Lazy Theta* postpones the line of sight check: a generated node optimistically gets the
+parent of the node that generated it, and the check is only done when the node is
+expanded. If there is no line of sight, the parent falls back to the best expanded
+neighbour (the plain A* parent). This needs about one line of sight check per
+expansion instead of one per generated node.
+
+Line of sight is a supercover Bresenham line done with numpy: all the cells the
+segment touches are computed at once and looked up in the wall mask. The check is
+skipped when the segment lies in the free disk (from the distance transform of the
+walls) around one of its ends, the results are cached per pair of cells, and the
+planner of a costmap is cached by its content, so replanning on the same map reuses them.
+A costmap with more walls than a cached one (the static map with the obstacles of
+local_costmap on top) gets a planner that asks the cached one first, and only retraces
+the lines that come close to the new walls.
+'''
+
+import heapq
+from collections import OrderedDict
+from math import sqrt
+
+import numpy as np
+
+from a_star import costmap_key
+from gridMap import distance_transform
+
+
+class thetaStar:
+
+    def __init__(self, costMap, threshold=0.8, max_cached_lines=1000000, base=None):
+        """
+        base: thetaStar of a costmap with a subset of the walls of costMap, its lines of sight are reused
+        """
+        self.maze = np.asarray(costMap).T
+        self.blocked = self.maze > threshold
+        self.base = base
+        # distance from every cell to the closest wall (only the ones base does not have), in cells
+        self.clearance = distance_transform(self.blocked if base is None else self.blocked & ~base.blocked).ravel()
+        self.rows, self.cols = self.maze.shape
+
+        self.max_cached_lines = max_cached_lines
+        self.lines = {}
+        self.steps = np.arange(max(self.rows, self.cols) + 1)
+
+        self.moves = [(d_row, d_col, sqrt(d_row**2 + d_col**2))
+                      for d_row in (-1, 0, 1) for d_col in (-1, 0, 1) if d_row or d_col]
+
+    def line_of_sight(self, a, b):
+        """
+        Whether the Bresenham line between the cells of flat indices a and b is free of walls.
+        """
+        key = (a, b) if a < b else (b, a)
+        visible = self.lines.get(key)
+        if visible is not None:
+            return visible
+
+        row_0, col_0 = divmod(key[0], self.cols)
+        row_1, col_1 = divmod(key[1], self.cols)
+        n = max(abs(row_1 - row_0), abs(col_1 - col_0))
+
+        if self.base is not None and not self.base.line_of_sight(key[0], key[1]):
+            visible = False
+        # the segment is inside the free disk around one of its ends, the cells it touches
+        # have their centres within half a cell diagonal of it
+        elif max(self.clearance[key[0]], self.clearance[key[1]]) > self.distance(key[0], key[1]) + 0.71:
+            visible = True
+        elif n <= 1:
+            visible = not (self.blocked[row_0, col_0] or self.blocked[row_1, col_1])
+        else:
+            visible = not self.line_blocked(row_0, col_0, row_1, col_1, n)
+
+        if len(self.lines) >= self.max_cached_lines:
+            self.lines.clear()
+        self.lines[key] = visible
+        return visible
+
+    def line_blocked(self, row_0, col_0, row_1, col_1, n):
+        """
+        Whether the segment between the two cell centres touches a wall, checking all the
+        cells it touches (supercover, corners included) so that it cannot cut the corner of a wall.
+        """
+        k = self.steps[:n + 1]
+        swapped = abs(col_1 - col_0) > abs(row_1 - row_0)
+        if swapped:
+            row_0, col_0, row_1, col_1 = col_0, row_0, col_1, row_1
+
+        # the minor coordinate where the line enters and leaves every cell of the major axis,
+        # it stays between col_0 and col_1 so the cells are always inside the grid
+        enter = col_0 + np.maximum(k - 0.5, 0.0) * ((col_1 - col_0) / n)
+        leave = col_0 + np.minimum(k + 0.5, n) * ((col_1 - col_0) / n)
+        low = np.floor(np.minimum(enter, leave) + 0.5 - 1e-9).astype(int)
+        high = np.floor(np.maximum(enter, leave) + 0.5 + 1e-9).astype(int)
+
+        major = row_0 + k if row_1 > row_0 else row_0 - k
+        blocked = self.blocked.T if swapped else self.blocked
+
+        return bool(blocked[major, low].any() or blocked[major, high].any()
+                    or blocked[major, np.minimum(low + 1, high)].any())
+
+    def distance(self, a, b):
+        row_0, col_0 = divmod(a, self.cols)
+        row_1, col_1 = divmod(b, self.cols)
+        return sqrt((row_1 - row_0)**2 + (col_1 - col_0)**2)
+
+    def search(self, start, end, stats=None, cancel_event=None):
+        """
+        Path from start to end (cells like a_star.search) as the list of its corner cells,
+        None if there is none or cancel_event was set. stats gets the number of expansions under "expansions".
+        """
+        start = int(start[0]) * self.cols + int(start[1])
+        goal = int(end[0]) * self.cols + int(end[1])
+        goal_row, goal_col = divmod(goal, self.cols)
+
+        g = {start: 0.0}
+        parent = {start: start}
+        closed = set()
+
+        open_list = [(self.distance(start, goal), start)]
+        expansions = 0
+
+        while open_list:
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+
+            _, node = heapq.heappop(open_list)
+            if node in closed:
+                continue
+
+            expansions += 1
+            row, col = divmod(node, self.cols)
+
+            # lazy line of sight check, fall back to the best expanded neighbour. The start is its
+            # own parent, it is often in the inflated band around the walls like in a_star.search
+            if node != start and not self.line_of_sight(parent[node], node):
+                best = None
+                for d_row, d_col, step in self.moves:
+                    neighbour_row, neighbour_col = row + d_row, col + d_col
+                    if not (0 <= neighbour_row < self.rows and 0 <= neighbour_col < self.cols):
+                        continue
+                    neighbour = neighbour_row * self.cols + neighbour_col
+                    if neighbour in closed and (best is None or g[neighbour] + step < best[0]):
+                        best = (g[neighbour] + step, neighbour)
+                g[node], parent[node] = best
+
+            if node == goal:
+                if stats is not None:
+                    stats["expansions"] = expansions
+                return self.return_path(parent, start, goal)
+
+            closed.add(node)
+            node_parent = parent[node]
+
+            for d_row, d_col, _ in self.moves:
+                neighbour_row, neighbour_col = row + d_row, col + d_col
+                if not (0 <= neighbour_row < self.rows and 0 <= neighbour_col < self.cols):
+                    continue
+                if self.blocked[neighbour_row, neighbour_col]:
+                    continue
+
+                neighbour = neighbour_row * self.cols + neighbour_col
+                if neighbour in closed:
+                    continue
+
+                # optimistic: the parent of node, checked once neighbour is expanded
+                new_g = g[node_parent] + self.distance(node_parent, neighbour)
+                if new_g < g.get(neighbour, float("inf")):
+                    g[neighbour] = new_g
+                    parent[neighbour] = node_parent
+                    heuristic = sqrt((goal_row - neighbour_row)**2 + (goal_col - neighbour_col)**2)
+                    heapq.heappush(open_list, (new_g + heuristic, neighbour))
+
+        if stats is not None:
+            stats["expansions"] = expansions
+        return None
+
+    def return_path(self, parent, start, goal):
+
+        path = [goal]
+        while path[-1] != start:
+            path.append(parent[path[-1]])
+
+        return [divmod(node, self.cols) for node in path[::-1]]
+
+
+# planners of the last costmaps, keyed by content like a_star.distance_fields_for
+THETA_STARS = OrderedDict()
+MAX_CACHED_MAPS = 4
+
+
+def theta_star_for(costMap, threshold=0.8, overlay=None):
+    """
+    Cached planner of costMap. With overlay (costMap with more walls, e.g. localCostmap.overlay)
+    a planner of overlay on top of the cached one, it is not cached itself.
+    """
+    key = costmap_key(costMap, threshold)
+
+    if key not in THETA_STARS:
+        THETA_STARS[key] = thetaStar(costMap, threshold)
+        while len(THETA_STARS) > MAX_CACHED_MAPS:
+            THETA_STARS.popitem(last=False)
+
+    THETA_STARS.move_to_end(key)
+
+    if overlay is None or overlay is costMap:
+        return THETA_STARS[key]
+    return thetaStar(overlay, threshold, base=THETA_STARS[key])
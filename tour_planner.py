@@ -0,0 +1,190 @@
+'''
+Multi-goal (waypoint tour) planning on the a_star grid.
+
+The path costs between all the waypoints come from the cost-to-go fields of
+a_star.distanceFields: one multi-source Dijkstra call gives the field of every
+waypoint, the pairwise costs are read off the fields, and the fields are cached per
+costmap so that touring the same inspection points again only runs the ordering.
+
+The visit order is a small TSP with a fixed start (and optionally a return to it),
+solved with a nearest neighbour tour improved by 2-opt (segment reversals) and
+Or-opt (moving runs of 1 to 3 waypoints), the 2-opt gains of all the reversals are
+evaluated at once with numpy. The legs are then read from the parent pointers of the
+fields and concatenated into a single path for trajectoryController.
+'''
+
+import numpy as np
+
+from a_star import distance_fields_for
+
+
+def tour_cost(order, distances):
+    return float(np.sum(distances[order[:-1], order[1:]]))
+
+
+def nearest_neighbour_tour(distances, closed=False):
+    """
+    Visit order starting at 0, always going to the closest waypoint not visited yet.
+    """
+    n = len(distances)
+    order = [0]
+    remaining = set(range(1, n))
+
+    while remaining:
+        candidates = np.array(sorted(remaining))
+        following = int(candidates[np.argmin(distances[order[-1], candidates])])
+        order.append(following)
+        remaining.remove(following)
+
+    if closed:
+        order.append(0)
+    return np.array(order)
+
+
+def two_opt(order, distances):
+    """
+    Reverses the segment order[i:j+1] with the largest gain until no reversal improves the tour.
+    order[0] is fixed, and so is order[-1] for a closed tour (it is 0 again).
+    """
+    order = order.copy()
+    n = len(order)
+    closed = order[0] == order[-1] and n > 2
+    last = n - 2 if closed else n - 1
+
+    i, j = np.triu_indices(last + 1, k=1)
+    keep = i >= 1
+    i, j = i[keep], j[keep]
+
+    while len(i):
+        before, first, end = order[i - 1], order[i], order[j]
+
+        # the edge after the segment only exists when the segment is not at the open end of the path
+        has_after = j + 1 < n
+        after = order[np.minimum(j + 1, n - 1)]
+
+        gain = distances[before, first] - distances[before, end]
+        gain += np.where(has_after, distances[end, after] - distances[first, after], 0.0)
+
+        best = int(np.argmax(gain))
+        if gain[best] <= 1e-9:
+            break
+
+        order[i[best]:j[best] + 1] = order[i[best]:j[best] + 1][::-1]
+
+    return order
+
+
+def or_opt(order, distances, max_segment=3):
+    """
+    Moves a run of 1..max_segment consecutive waypoints (possibly reversed) to the best other
+    place in the tour, as long as that shortens the tour. The fixed ends stay in place.
+    """
+    order = list(order)
+    closed = order[0] == order[-1] and len(order) > 2
+
+    improved = True
+    while improved:
+        improved = False
+        current = tour_cost(np.array(order), distances)
+
+        last = len(order) - 1 if closed else len(order)
+        for length in range(1, max_segment + 1):
+            for start in range(1, last - length + 1):
+                segment = order[start:start + length]
+                rest = order[:start] + order[start + length:]
+
+                # every place the segment can be inserted at, after rest[position - 1]
+                positions = np.arange(1, len(rest) if closed else len(rest) + 1)
+                for candidate in (segment, segment[::-1]):
+                    costs = [tour_cost(np.array(rest[:p] + candidate + rest[p:]), distances) for p in positions]
+                    best = int(np.argmin(costs))
+                    if costs[best] < current - 1e-9:
+                        order = rest[:positions[best]] + candidate + rest[positions[best]:]
+                        current = costs[best]
+                        improved = True
+                        break
+                if improved:
+                    break
+            if improved:
+                break
+
+    return np.array(order)
+
+
+def solve_tour(distances, closed=False):
+    """
+    Visit order of the waypoints of the (n, n) cost matrix, starting at waypoint 0
+    (and returning to it if closed).
+    """
+    distances = np.asarray(distances, dtype=float)
+    if len(distances) < 3:
+        return np.array(list(range(len(distances))) + ([0] if closed and len(distances) > 1 else []))
+
+    order = nearest_neighbour_tour(distances, closed)
+
+    # the two moves are alternated until neither improves the tour
+    while True:
+        cost = tour_cost(order, distances)
+        order = or_opt(two_opt(order, distances), distances)
+        if tour_cost(order, distances) >= cost - 1e-9:
+            return order
+
+
+def plan_tour(costMap, start, waypoints, closed=False, threshold=0.8, cancel_event=None):
+    """
+    Shortest tour from start through all the waypoints (cells, indexed like a_star.search).
+    Returns the visit order (indices in waypoints) and the legs of the tour, one list of cells
+    per leg, or (None, None) if some waypoint cannot be reached or cancel_event was set.
+    concatenate_legs joins them.
+    """
+    def cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    fields = distance_fields_for(costMap, threshold)
+
+    cells = [tuple(int(v) for v in start)] + [tuple(int(v) for v in waypoint) for waypoint in waypoints]
+
+    if cancelled():
+        return None, None
+
+    # waypoints on obstacles cannot be reached, the start can be on one like in a_star.search
+    try:
+        fields.compute(cells, starts=cells[:1])
+    except ValueError:
+        return None, None
+
+    # pairwise costs from the fields, every field gives one row of the matrix
+    rows, cols = np.array(cells).T
+    distances = np.array([fields.field(cell)[0][rows, cols] for cell in cells])
+    distances = np.minimum(distances, distances.T)
+
+    if not np.all(np.isfinite(distances)):
+        return None, None
+
+    if cancelled():
+        return None, None
+
+    order = solve_tour(distances, closed)
+
+    legs = []
+    for source, target in zip(order[:-1], order[1:]):
+        if cancelled():
+            return None, None
+        leg = fields.path(cells[source], cells[target])
+        # no field leads into a start on an obstacle, the leg back to it is the one from it reversed
+        if leg is None:
+            leg = fields.path(cells[target], cells[source])[::-1]
+        legs.append(leg)
+
+    visits = [int(k) - 1 for k in order[1:] if k != 0]
+    return visits, legs
+
+
+def concatenate_legs(legs):
+    """
+    One path through all the legs, the joint of two legs is only kept once.
+    """
+    path = list(legs[0])
+    for leg in legs[1:]:
+        path += list(leg[1:])
+    return path
@@ -1,5 +1,4 @@
 from math import atan2, asin, sqrt
-from sensor_msgs.msg import LaserScan
 
 import numpy as np
 
@@ -13,6 +12,15 @@ def normalize_angle(theta):
     return theta
 
 
+def stamp_to_ns(stamp):
+    """
+    Nanoseconds of a builtin_interfaces/Time stamp, stamps that are already ints are returned as they are.
+    """
+    if isinstance(stamp, (int, np.integer)):
+        return int(stamp)
+    return stamp.sec * 1000000000 + stamp.nanosec
+
+
 class Logger:
     def __init__(self, filename, headers=["e", "e_dot", "e_int", "stamp"]):
         self.filename = filename
@@ -132,7 +140,7 @@ def calculate_angular_error(current_pose, goal_pose):
     return error_angular
 
 
-def convertScanToCartesian(laserScan: LaserScan):
+def convertScanToCartesian(laserScan: "sensor_msgs.msg.LaserScan"):
 
     angle_min = laserScan.angle_min
     angle_increment = laserScan.angle_increment